@@ -8,5 +8,12 @@ pip install --upgrade pip
 pip install --use-deprecated=legacy-resolver -r requirements.txt
 
 # Standard deployment steps
+python manage.py bundle_static
 python manage.py collectstatic --noinput
-python manage.py migrate
\ No newline at end of file
+python manage.py migrate
+python manage.py createcachetable
+
+# Local postcode index, when a dataset is configured
+if [ -n "$POSTCODE_DATA_URL" ]; then
+    python manage.py load_postcodes "$POSTCODE_DATA_URL"
+fi
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 
 # Build paths
@@ -44,8 +45,10 @@ INSTALLED_APPS = [
 ]
 
 # MIDDLEWARE
+# Every custom middleware handles both WSGI and ASGI requests natively
 MIDDLEWARE = [
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.middleware.StaticFilesMiddleware',  # WhiteNoise
+    'core.middleware.PerformanceMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",  # NEW: Must be above CommonMiddleware
@@ -53,6 +56,7 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     'core.middleware.UpdateLastActiveMiddleware',
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    'core.middleware.AccessScopeMiddleware',
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -81,6 +85,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "core.context_processors.navigation",
             ],
         },
     },
@@ -94,8 +99,31 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD'),
         'HOST': os.environ.get('DB_HOST'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        # Keep connections open between requests instead of reconnecting every time;
+        # health checks replace a connection that went away while idle
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
     }
 }
+
+# Under ASGI each request's sync code runs on a new thread with its own connection, so a
+# persistent one is never reused and they pile up until they age out: close them after every
+# request there, as Django's async docs advise, and reuse them through the pool instead
+SERVING_ASGI = os.environ.get('DJANGO_ASGI') == 'True'
+if SERVING_ASGI:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+# DB_POOL=True (the default under ASGI) uses psycopg 3's connection pool; the pool hands
+# connections between requests, so persistent connections are turned off
+if os.environ.get('DB_POOL', str(SERVING_ASGI)) == 'True':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        },
+    }
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -110,6 +138,93 @@ LOGGING = {
     },
 }
 
+# PERFORMANCE INSTRUMENTATION
+PERFORMANCE_INSTRUMENTATION = os.environ.get("PERFORMANCE_INSTRUMENTATION", "True") == "True"
+PERFORMANCE_SLOW_REQUEST_MS = int(os.environ.get("PERFORMANCE_SLOW_REQUEST_MS", "1000"))
+# Debugging mode: keep slow queries with their origin and EXPLAIN plan (needs the instrumentation above)
+SLOW_QUERY_CAPTURE = os.environ.get("SLOW_QUERY_CAPTURE", "False") == "True"
+SLOW_QUERY_THRESHOLD_MS = int(os.environ.get("SLOW_QUERY_THRESHOLD_MS", "100"))
+SLOW_QUERY_BUFFER_SIZE = int(os.environ.get("SLOW_QUERY_BUFFER_SIZE", "100"))
+
+# BACKGROUND JOBS
+# Follow-up work (rescans, PDF rendering) runs on a thread pool after commit; eager runs it inline
+BACKGROUND_JOB_WORKERS = int(os.environ.get("BACKGROUND_JOB_WORKERS", "2"))
+BACKGROUND_JOBS_EAGER = os.environ.get("BACKGROUND_JOBS_EAGER", "False") == "True"
+
+# SCHEDULER
+# manage.py run_scheduler: minutes after a shift ends before its missed logs are recorded,
+# and PDFs rendered per backfill run
+MISSED_LOG_GRACE_MINUTES = int(os.environ.get("MISSED_LOG_GRACE_MINUTES", "30"))
+PDF_BACKFILL_BATCH_SIZE = int(os.environ.get("PDF_BACKFILL_BATCH_SIZE", "50"))
+# Opt-in: age in days after which resolved missed logs and shift coverage are moved out of the
+# database into gzipped CSV files in ARCHIVE_DIR (keep it on persistent storage, outside MEDIA_ROOT)
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "0"))
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", os.path.join(BASE_DIR, "archive"))
+
+# PDF RENDERING
+# Engine per document type: weasyprint or xhtml2pdf (from the HTML template), or reportlab
+# for the shift log, which is drawn directly as a table. Compare with run_benchmarks --group pdf_engines
+PDF_ENGINES = {
+    "shift_log": os.environ.get("PDF_ENGINE_SHIFT_LOG", "weasyprint"),
+    "abc_form": os.environ.get("PDF_ENGINE_ABC_FORM", "weasyprint"),
+    "incident_report": os.environ.get("PDF_ENGINE_INCIDENT_REPORT", "weasyprint"),
+}
+# HTML engines render in spawned worker processes (0 renders inside the web process), each
+# capped at PDF_RENDER_MEMORY_MB of address space (0 for no cap) and PDF_RENDER_TIMEOUT
+# seconds per document, and replaced after PDF_RENDER_MAX_TASKS renders
+PDF_RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", "2"))
+PDF_RENDER_MEMORY_MB = int(os.environ.get("PDF_RENDER_MEMORY_MB", "1024"))
+PDF_RENDER_TIMEOUT = int(os.environ.get("PDF_RENDER_TIMEOUT", "60"))
+PDF_RENDER_MAX_TASKS = int(os.environ.get("PDF_RENDER_MAX_TASKS", "20"))
+
+# EMAIL
+# Console by default so local runs print mail; set EMAIL_BACKEND/EMAIL_HOST etc. in production
+EMAIL_BACKEND = os.environ.get("EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend")
+EMAIL_FILE_PATH = os.environ.get("EMAIL_FILE_PATH", os.path.join(BASE_DIR, "sent_emails"))
+EMAIL_HOST = os.environ.get("EMAIL_HOST", "localhost")
+EMAIL_PORT = int(os.environ.get("EMAIL_PORT", "25"))
+EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER", "")
+EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", "")
+EMAIL_USE_TLS = os.environ.get("EMAIL_USE_TLS", "False") == "True"
+DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", "webmaster@localhost")
+# Missed logs claimed per digest batch
+MISSED_LOG_DIGEST_BATCH_SIZE = int(os.environ.get("MISSED_LOG_DIGEST_BATCH_SIZE", "500"))
+
+# CACHE
+# CACHE_BACKEND=locmem (per process), file or db (shared by all workers; run createcachetable)
+CACHE_BACKENDS = {
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "carehome"),
+    "file": ("django.core.cache.backends.filebased.FileBasedCache", os.path.join(BASE_DIR, "django_cache")),
+    "db": ("django.core.cache.backends.db.DatabaseCache", "core_cache"),
+}
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "locmem")
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND][0],
+        "LOCATION": os.environ.get("CACHE_LOCATION", CACHE_BACKENDS[CACHE_BACKEND][1]),
+        "TIMEOUT": int(os.environ.get("CACHE_TIMEOUT", "300")),
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("CACHE_MAX_ENTRIES", "5000"))},
+    }
+}
+# Seconds the sidebar and topbar fragments stay cached; changes retire them early
+NAV_FRAGMENT_CACHE_TIMEOUT = int(os.environ.get("NAV_FRAGMENT_CACHE_TIMEOUT", "600"))
+
+# POSTCODES
+# Local index built by manage.py load_postcodes; postcodes it doesn't know are checked with postcodes.io
+POSTCODE_INDEX_PATH = os.environ.get("POSTCODE_INDEX_PATH", os.path.join(BASE_DIR, "data", "postcodes.idx"))
+POSTCODE_API_TIMEOUT = float(os.environ.get("POSTCODE_API_TIMEOUT", "2"))
+# Accept well-formed postcodes the index doesn't know while postcodes.io is down or slow
+POSTCODE_ACCEPT_WHEN_UNAVAILABLE = os.environ.get("POSTCODE_ACCEPT_WHEN_UNAVAILABLE", "False") == "True"
+
+# DROPDOWN LOOKUPS
+# Seconds a care home's resident/staff list stays cached; saves clear it early in the saving process
+LOOKUP_CACHE_TIMEOUT = int(os.environ.get("LOOKUP_CACHE_TIMEOUT", "300"))
+
+# ACCESS SCOPES
+# Seconds a user's permissions stay cached. Changes retire them at once in the process that made
+# them (every process with a shared CACHE_BACKEND); this bounds how long other locmem workers lag
+ACCESS_SCOPE_CACHE_TIMEOUT = int(os.environ.get("ACCESS_SCOPE_CACHE_TIMEOUT", "300"))
+
 # PASSWORD VALIDATION
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -140,6 +255,35 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')  # For collectstatic on Render
 
+# collectstatic writes content-hashed copies with .gz/.br siblings; WhiteNoise serves the hashed
+# ones as immutable for a year. They only exist after collectstatic, so DEBUG and tests use plain files
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage" if DEBUG or TESTING
+        else "whitenoise.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+# Unhashed static URLs (anything not behind {% static %})
+WHITENOISE_MAX_AGE = 60 * 60
+
+# Files concatenated by manage.py bundle_static into core/static/bundles/, used by {% bundle %}
+STATIC_BUNDLES_DIR = os.path.join(BASE_DIR, 'core', 'static', 'bundles')
+STATIC_BUNDLES = {
+    'base.css': [
+        'css/sb-admin-2.min.css',
+        'vendor/fontawesome-free/css/all.min.css',
+    ],
+    'base.js': [
+        'vendor/jquery/jquery.min.js',
+        'vendor/bootstrap/js/bootstrap.bundle.min.js',
+        'vendor/jquery-easing/jquery.easing.min.js',
+        'js/sb-admin-2.min.js',
+    ],
+}
+STATIC_BUNDLES_ENABLED = os.environ.get("STATIC_BUNDLES_ENABLED", str(not (DEBUG or TESTING))) == "True"
+
 # MEDIA
 MEDIA_URL = '/media/'
 # MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -3,9 +3,11 @@ from django.contrib import admin
 from django.urls import path, include, re_path
 
 from carehome_project import settings
-from core.views import serve_media
+from core.views import serve_media, performance_summary_view, slow_queries_view
 
 urlpatterns = [
+    path('admin/performance/', performance_summary_view, name='performance-summary'),
+    path('admin/slow-queries/', slow_queries_view, name='slow-queries'),
     path('admin/', admin.site.urls),
     path('', include('core.urls'))
 ]
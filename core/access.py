@@ -0,0 +1,134 @@
+"""
+Per-user access scope.
+
+Which care homes and residents a user may work with, their role and whether
+they are in the ``Supervisors`` group, worked out once and cached. Any change
+that can affect a scope (users, groups, care home managers, mappings, residents)
+bumps one global version through ``core.signals``, which retires every cached
+scope at once. ``core.middleware.AccessScopeMiddleware`` exposes the scope as
+``request.access``; async views use ``aget_scope()`` instead.
+
+With a per-process cache (``CACHE_BACKEND=locmem``) a bump only reaches the
+worker that made the change, so other workers can keep granting access removed
+elsewhere until their copy expires: ``ACCESS_SCOPE_CACHE_TIMEOUT`` bounds that.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import CareHome, CustomUser, Mapping, ServiceUser
+
+SUPERVISOR_GROUP = 'Supervisors'
+VERSION_KEY = 'access:version'
+
+
+class AccessScope:
+    def __init__(self, user_id, role, is_superuser=False, is_supervisor=False,
+                 all_carehomes=False, carehome_ids=(), service_user_ids=None):
+        self.user_id = user_id
+        self.role = role
+        self.is_superuser = is_superuser
+        self.is_supervisor = is_supervisor
+        self.all_carehomes = all_carehomes
+        self.carehome_ids = frozenset(carehome_ids)
+        # None when every resident is in scope
+        self.service_user_ids = None if service_user_ids is None else frozenset(service_user_ids)
+
+    @property
+    def is_manager(self):
+        return self.is_superuser or self.role == CustomUser.Manager
+
+    @property
+    def is_team_lead(self):
+        return self.role == CustomUser.TEAM_LEAD
+
+    def has_carehome(self, carehome_id):
+        return self.all_carehomes or carehome_id in self.carehome_ids
+
+    def has_service_user(self, service_user_id):
+        return self.service_user_ids is None or service_user_id in self.service_user_ids
+
+    def carehomes(self):
+        if self.all_carehomes:
+            return CareHome.objects.all()
+        return CareHome.objects.filter(id__in=self.carehome_ids)
+
+    def as_dict(self):
+        return {
+            'user_id': self.user_id,
+            'role': self.role,
+            'is_superuser': self.is_superuser,
+            'is_supervisor': self.is_supervisor,
+            'all_carehomes': self.all_carehomes,
+            'carehome_ids': sorted(self.carehome_ids),
+            'service_user_ids': None if self.service_user_ids is None else sorted(self.service_user_ids),
+        }
+
+    @classmethod
+    def build(cls, user):
+        """
+        Managers and superusers see everything. Team leads get their own care home,
+        staff their own and mapped care homes plus directly mapped residents.
+        """
+        is_supervisor = user.groups.filter(name=SUPERVISOR_GROUP).exists()
+        if user.is_superuser or user.role == CustomUser.Manager:
+            return cls(user.pk, user.role, user.is_superuser, is_supervisor, all_carehomes=True,
+                       carehome_ids=CareHome.objects.values_list('id', flat=True))
+
+        carehome_ids = {user.carehome_id} if user.carehome_id else set()
+        service_user_ids = set()
+        if user.role == CustomUser.STAFF:
+            carehome_ids.update(Mapping.carehomes.through.objects.filter(
+                mapping__staff=user
+            ).values_list('carehome_id', flat=True))
+            service_user_ids.update(Mapping.service_users.through.objects.filter(
+                mapping__staff=user
+            ).values_list('serviceuser_id', flat=True))
+        service_user_ids.update(
+            ServiceUser.objects.filter(carehome_id__in=carehome_ids).values_list('id', flat=True)
+        )
+        return cls(user.pk, user.role, user.is_superuser, is_supervisor,
+                   carehome_ids=carehome_ids, service_user_ids=service_user_ids)
+
+
+def _timeout():
+    return getattr(settings, 'ACCESS_SCOPE_CACHE_TIMEOUT', 300)
+
+
+def _version():
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def get_scope(user):
+    """The cached ``AccessScope`` of ``user``, building it on a miss"""
+    if not user.is_authenticated:
+        return AccessScope(None, None, service_user_ids=())
+    key = f'access:{_version()}:{user.pk}'
+    data = cache.get(key)
+    if data is None:
+        scope = AccessScope.build(user)
+        cache.set(key, scope.as_dict(), _timeout())
+        return scope
+    return AccessScope(**data)
+
+
+async def aget_scope(user):
+    """``get_scope`` for async views; pass the user from ``await request.auser()``"""
+    if not user.is_authenticated:
+        return AccessScope(None, None, service_user_ids=())
+    key = f"access:{await cache.aget_or_set(VERSION_KEY, 1, None)}:{user.pk}"
+    data = await cache.aget(key)
+    if data is None:
+        scope = await sync_to_async(AccessScope.build)(user)
+        await cache.aset(key, scope.as_dict(), _timeout())
+        return scope
+    return AccessScope(**data)
+
+
+def invalidate_all():
+    """Retire every cached scope"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
@@ -6,7 +6,7 @@ from django.core.exceptions import FieldError
 from django.utils import timezone
 
 from .models import CustomUser, CareHome, ServiceUser, LogEntry, Mapping, IncidentReport, ABCForm, LatestLogEntry, \
-    MissedLog
+    MissedLog, ScheduledJobRun
 
 
 @admin.register(CustomUser)
@@ -95,7 +95,7 @@ class ABCFormAdmin(admin.ModelAdmin):
         'created_at',
         'updated_by_display'  # Custom method instead of direct field
     ]
-    list_filter = ['date_time', 'created_by']
+    list_filter = ['date_time', 'created_by', 'antecedent_change', 'antecedent_noise']
     search_fields = ['service_user__first_name', 'service_user__last_name', 'staff']
 
     def updated_by_display(self, obj):
@@ -138,3 +138,13 @@ class MissedLogAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         six_months_ago = timezone.now() - timedelta(days=180)
         return super().get_queryset(request).filter(date__gte=six_months_ago)
+
+
+@admin.register(ScheduledJobRun)
+class ScheduledJobRunAdmin(admin.ModelAdmin):
+    list_display = ('name', 'last_run_at', 'last_finished_at', 'locked_until', 'failed')
+    readonly_fields = ('name', 'last_run_at', 'last_finished_at', 'last_error', 'locked_until')
+
+    def failed(self, obj):
+        return bool(obj.last_error)
+    failed.boolean = True
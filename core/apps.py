@@ -7,4 +7,11 @@ class CoreConfig(AppConfig):
 
     def ready(self):
         import core.signals
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+        from .instrumentation import install_query_timer
+
+        connection_created.connect(install_query_timer)
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection=connection)
 
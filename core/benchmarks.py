@@ -0,0 +1,266 @@
+"""
+Benchmark scenarios for the hot views and PDF renderers.
+
+Each scenario is a function taking a ``BenchmarkContext`` and performing one
+unit of work (usually a request through the test client). ``run_scenario``
+records wall time, query count and peak Python memory for it; the
+``run_benchmarks`` management command runs them against whatever data is in
+the database (see ``seed_scale``) and saves the results as JSON.
+
+The ``pdf_engines`` group renders the same shift log with each PDF engine
+(see ``core.rendering``) to decide which one ``PDF_ENGINES`` should bind.
+
+Scenarios run in a transaction that is rolled back, except the ``connections``
+group: those open and close database connections the way a request does, which
+a transaction would prevent. Run that group once per connection setting
+(``DB_CONN_MAX_AGE``, ``DB_POOL``) and compare the results. The test client is
+WSGI-style; under ASGI persistent connections are off and ``DB_POOL``, on by
+default there, reuses connections.
+"""
+import statistics
+import time
+import tracemalloc
+
+from django.db import close_old_connections, connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import rendering
+from .models import CustomUser, LatestLogEntry, ABCForm, IncidentReport
+
+SCENARIOS = {}
+
+
+class Scenario:
+    def __init__(self, name, group, func, atomic=True):
+        self.name = name
+        self.group = group
+        self.func = func
+        self.atomic = atomic
+
+
+def scenario(name, group='views', atomic=True):
+    """Register a benchmark scenario under ``name``; ``atomic=False`` for read-only ones that must commit"""
+    def decorator(func):
+        SCENARIOS[name] = Scenario(name, group, func, atomic)
+        return func
+    return decorator
+
+
+class BenchmarkContext:
+    """Users, sample rows and logged-in clients shared by every scenario"""
+
+    def __init__(self):
+        self._clients = {}
+        self.users = {
+            'manager': CustomUser.objects.filter(role=CustomUser.Manager, is_active=True).first(),
+            'team_lead': CustomUser.objects.filter(role=CustomUser.TEAM_LEAD, is_active=True).first(),
+        }
+        self.latest_log = LatestLogEntry.objects.filter(
+            user__role=CustomUser.STAFF
+        ).select_related('user').order_by('-date', '-id').first()
+        self.users['staff'] = self.latest_log.user if self.latest_log else None
+        self.abc_form = ABCForm.objects.select_related('service_user').order_by('-date_time').first()
+        self.incident = IncidentReport.objects.order_by('-incident_datetime').first()
+
+        # Log in up front: sessions created inside a scenario would be rolled back with it
+        for role, user in self.users.items():
+            if user is not None:
+                client = Client()
+                client.force_login(user)
+                self._clients[role] = client
+
+    def missing(self):
+        """Names of fixtures the database could not provide"""
+        missing = [role for role, user in self.users.items() if user is None]
+        for name in ('latest_log', 'abc_form', 'incident'):
+            if getattr(self, name) is None:
+                missing.append(name)
+        return missing
+
+    def client(self, role):
+        return self._clients[role]
+
+    def get(self, role, url_name, *args):
+        return self.client(role).get(reverse(url_name, args=args))
+
+    def post(self, role, url_name, *args, data=None):
+        return self.client(role).post(reverse(url_name, args=args), data or {})
+
+
+def _run_once(func, ctx, atomic=True):
+    """Run one iteration inside a transaction that is always rolled back"""
+    if not atomic:
+        return func(ctx)
+    with transaction.atomic():
+        result = func(ctx)
+        transaction.set_rollback(True)
+    return result
+
+
+def run_scenario(scenario, ctx, iterations=5):
+    timings = []
+    query_count = 0
+    status = None
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result = _run_once(scenario.func, ctx, scenario.atomic)
+            timings.append(time.perf_counter() - started)
+        query_count = len(queries.captured_queries)
+        status = getattr(result, 'status_code', status)
+
+    # Memory is measured on a separate run, tracemalloc slows everything down
+    tracemalloc.start()
+    try:
+        _run_once(scenario.func, ctx, scenario.atomic)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'group': scenario.group,
+        'status': status,
+        'iterations': iterations,
+        'wall_ms': {
+            'median': round(statistics.median(timings) * 1000, 2),
+            'min': round(min(timings) * 1000, 2),
+            'max': round(max(timings) * 1000, 2),
+        },
+        'queries': query_count,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def compare_results(current, baseline, tolerance=0.2):
+    """
+    Return a list of regressions between two result sets.
+    Wall time and memory may grow by ``tolerance``; query counts may not grow at all.
+    """
+    regressions = []
+    for name, result in current.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if result['queries'] > before['queries']:
+            regressions.append(f"{name}: queries {before['queries']} -> {result['queries']}")
+        if result['wall_ms']['median'] > before['wall_ms']['median'] * (1 + tolerance):
+            regressions.append(
+                f"{name}: median {before['wall_ms']['median']}ms -> {result['wall_ms']['median']}ms"
+            )
+        if result['peak_kb'] > before['peak_kb'] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory {before['peak_kb']}KB -> {result['peak_kb']}KB")
+    return regressions
+
+
+@scenario('dashboard_manager')
+def dashboard_manager(ctx):
+    return ctx.get('manager', 'admin-dashboard')
+
+
+@scenario('dashboard_staff')
+def dashboard_staff(ctx):
+    return ctx.get('staff', 'admin-dashboard')
+
+
+@scenario('staff_latest_logs_view_team_lead')
+def staff_latest_logs_team_lead(ctx):
+    return ctx.get('team_lead', 'staff_latest_logs_view')
+
+
+@scenario('staff_latest_logs_view_staff')
+def staff_latest_logs_staff(ctx):
+    return ctx.get('staff', 'staff_latest_logs_view')
+
+
+@scenario('incident_report_list_view')
+def incident_report_list(ctx):
+    return ctx.get('manager', 'incident_report_list')
+
+
+@scenario('abc_form_list')
+def abc_form_list(ctx):
+    return ctx.get('manager', 'abc_form_list')
+
+
+@scenario('log_entry_form')
+def log_entry_form(ctx):
+    return ctx.get('staff', 'log-entry-form', ctx.latest_log.id)
+
+
+@scenario('save_log_entry')
+def save_log_entry(ctx):
+    entry = ctx.latest_log.log_entries.order_by('time_slot').first()
+    return ctx.post('staff', 'save-log', entry.id, data={'content': 'Benchmark entry'})
+
+
+@scenario('lock_log_entries')
+def lock_log_entries(ctx):
+    return ctx.post('staff', 'lock-log', ctx.latest_log.id)
+
+
+@scenario('missed_shifts_view')
+def missed_shifts(ctx):
+    return ctx.get('manager', 'missed-logs')
+
+
+@scenario('pdf_shift_log', group='pdf')
+def pdf_shift_log(ctx):
+    return ctx.latest_log.generate_pdf()
+
+
+@scenario('pdf_abc_form', group='pdf')
+def pdf_abc_form(ctx):
+    from .views import generate_abc_pdf
+    return generate_abc_pdf(ctx.abc_form)
+
+
+@scenario('pdf_incident_report', group='pdf')
+def pdf_incident_report(ctx):
+    return ctx.get('manager', 'download_incident_pdf', ctx.incident.id)
+
+
+def _shift_log_with(engine):
+    def render(ctx):
+        return rendering.render_document('shift_log', {
+            'latest_log': ctx.latest_log,
+            'log_entries': ctx.latest_log.log_entries.order_by('time_slot'),
+        }, engine=engine)
+    return render
+
+
+# The same shift log through every engine that can draw it
+for _engine in rendering.engines_for('shift_log'):
+    scenario(f'pdf_shift_log_{_engine}', group='pdf_engines')(_shift_log_with(_engine))
+
+
+def connection_settings():
+    """The connection handling in effect, saved with the results"""
+    return {
+        'conn_max_age': connection.settings_dict.get('CONN_MAX_AGE', 0),
+        'health_checks': connection.settings_dict.get('CONN_HEALTH_CHECKS', False),
+        'pool': bool(connection.settings_dict.get('OPTIONS', {}).get('pool')),
+    }
+
+
+def _request_cycle(ctx):
+    # The test client skips the request_started/finished connection handling, so do it here
+    close_old_connections()
+    try:
+        return ctx.get('manager', 'ajax-service-user-dob')
+    finally:
+        close_old_connections()
+
+
+@scenario('request_reusing_connection', group='connections', atomic=False)
+def request_reusing_connection(ctx):
+    """A request as configured: a persistent or pooled connection is reused"""
+    return _request_cycle(ctx)
+
+
+@scenario('request_new_connection', group='connections', atomic=False)
+def request_new_connection(ctx):
+    """A request that has to connect first, as with CONN_MAX_AGE=0 and no pool"""
+    connection.close()
+    return _request_cycle(ctx)
@@ -0,0 +1,30 @@
+"""
+Template context shared by every page.
+
+``nav_version`` is part of the cache key of the sidebar and topbar fragments in
+``core/base.html``; ``core.signals`` bumps it when care homes, residents or
+users change, which retires every cached fragment at once.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+NAV_VERSION_KEY = 'nav:version'
+
+
+def get_nav_version():
+    return cache.get_or_set(NAV_VERSION_KEY, 1, None)
+
+
+def invalidate_navigation():
+    """Retire every cached navigation fragment"""
+    try:
+        cache.incr(NAV_VERSION_KEY)
+    except ValueError:
+        cache.set(NAV_VERSION_KEY, 2, None)
+
+
+def navigation(request):
+    return {
+        'nav_version': get_nav_version(),
+        'nav_cache_timeout': getattr(settings, 'NAV_FRAGMENT_CACHE_TIMEOUT', 600),
+    }
@@ -189,11 +189,13 @@ class ABCFormForm(forms.ModelForm):
     # Setting fields
     setting_location = forms.CharField(
         label="Where did the behavior occur?",
+        max_length=255,
         widget=forms.TextInput(attrs={'class': 'form-control'}),
         required=True
     )
     setting_present = forms.CharField(
         label="Who was present?",
+        max_length=255,
         widget=forms.TextInput(attrs={'class': 'form-control'}),
         required=True
     )
@@ -216,18 +218,19 @@ class ABCFormForm(forms.ModelForm):
     )
     antecedent_change = forms.ChoiceField(
         label="Was there a change in routine?",
-        choices=[('yes', 'Yes'), ('no', 'No')],
+        choices=ABCForm.YES_NO_CHOICES,
         widget=forms.Select(attrs={'class': 'form-control'}),
         initial='no'
     )
     antecedent_noise = forms.ChoiceField(
         label="Was there unexpected noise?",
-        choices=[('yes', 'Yes'), ('no', 'No')],
+        choices=ABCForm.YES_NO_CHOICES,
         widget=forms.Select(attrs={'class': 'form-control'}),
         initial='no'
     )
     antecedent_waiting = forms.CharField(
         label="Was the client waiting for something?",
+        max_length=255,
         widget=forms.TextInput(attrs={'class': 'form-control'}),
         required=False
     )
@@ -255,7 +258,12 @@ class ABCFormForm(forms.ModelForm):
 
     class Meta:
         model = ABCForm
-        fields = ['service_user', 'date_of_birth', 'staff', 'date_time', 'target_behaviours']
+        fields = [
+            'service_user', 'date_of_birth', 'staff', 'date_time', 'target_behaviours',
+            'setting_location', 'setting_present', 'setting_activity', 'setting_environment',
+            'antecedent_description', 'antecedent_change', 'antecedent_noise', 'antecedent_waiting',
+            'behaviour_description', 'consequence_immediate', 'reflection_learnings',
+        ]
         widgets = {
             'service_user': forms.Select(attrs={
                 'class': 'form-control select2',
@@ -281,75 +289,6 @@ class ABCFormForm(forms.ModelForm):
         # Order service users by last name
         self.fields['service_user'].label_from_instance = lambda obj: obj.get_formatted_name()
 
-        # Parse existing instance data for edit view
-        if self.instance and self.instance.pk:
-            self.parse_instance_data()
-
-    def parse_instance_data(self):
-        """Parse the combined fields into individual form fields"""
-        # Parse setting
-        setting_data = self.parse_field_text(self.instance.setting)
-        self.initial.update({
-            'setting_location': setting_data.get('Location', ''),
-            'setting_present': setting_data.get('Present', ''),
-            'setting_activity': setting_data.get('Activity', ''),
-            'setting_environment': setting_data.get('Environment', '')
-        })
-
-        # Parse antecedent
-        antecedent_data = self.parse_field_text(self.instance.antecedent)
-        self.initial.update({
-            'antecedent_description': antecedent_data.get('Description', ''),
-            'antecedent_change': antecedent_data.get('Routine change', 'no'),
-            'antecedent_noise': antecedent_data.get('Unexpected noise', 'no'),
-            'antecedent_waiting': antecedent_data.get('Waiting for', '')
-        })
-
-        # Parse other fields
-        behaviour_data = self.parse_field_text(self.instance.behaviour)
-        self.initial['behaviour_description'] = behaviour_data.get('Description', '')
-
-        consequences_data = self.parse_field_text(self.instance.consequences)
-        self.initial['consequence_immediate'] = consequences_data.get('Immediate', '')
-
-        reflection_data = self.parse_field_text(self.instance.reflection)
-        self.initial['reflection_learnings'] = reflection_data.get('Learnings', '')
-
-    @staticmethod
-    def parse_field_text(text):
-        """Helper method to parse field text into dictionary"""
-        if not text:
-            return {}
-        return dict(line.split(':', 1) for line in text.split('\n') if ':' in line)
-
-    def save(self, commit=True):
-        instance = super().save(commit=False)
-
-        # Combine individual fields into model's text fields
-        instance.setting = "\n".join([
-            f"Location: {self.cleaned_data.get('setting_location', '')}",
-            f"Present: {self.cleaned_data.get('setting_present', '')}",
-            f"Activity: {self.cleaned_data.get('setting_activity', '')}",
-            f"Environment: {self.cleaned_data.get('setting_environment', '')}"
-        ])
-
-        instance.antecedent = "\n".join([
-            f"Description: {self.cleaned_data.get('antecedent_description', '')}",
-            f"Routine change: {self.cleaned_data.get('antecedent_change', 'no')}",
-            f"Unexpected noise: {self.cleaned_data.get('antecedent_noise', 'no')}",
-            f"Waiting for: {self.cleaned_data.get('antecedent_waiting', '')}"
-        ])
-
-        instance.behaviour = f"Description: {self.cleaned_data.get('behaviour_description', '')}"
-        instance.consequences = f"Immediate: {self.cleaned_data.get('consequence_immediate', '')}"
-        instance.reflection = f"Learnings: {self.cleaned_data.get('reflection_learnings', '')}"
-
-        if commit:
-            instance.save()
-            self.save_m2m()
-
-        return instance
-
 
 class StaffEditForm(forms.ModelForm):
     role = forms.ChoiceField(
@@ -0,0 +1,252 @@
+"""
+Per-request performance metrics.
+
+``PerformanceMiddleware`` opens a ``RequestMetrics`` for every request; code
+running inside it adds to the current one through ``timed()`` (PDF rendering),
+the database execute wrapper and the template render hook. Finished requests
+are kept in a small in-process rolling window per view for the admin summary.
+
+With ``SLOW_QUERY_CAPTURE`` on, queries slower than ``SLOW_QUERY_THRESHOLD_MS``
+are also kept in a bounded ring buffer together with the app code that issued
+them and their ``EXPLAIN`` plan.
+"""
+import os
+import threading
+import time
+import traceback
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+_current = ContextVar('request_metrics', default=None)
+_explaining = ContextVar('explaining', default=False)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Requests kept per view for the rolling summary
+WINDOW_SIZE = 200
+
+
+class RequestMetrics:
+    def __init__(self, path=None):
+        self.path = path
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sections = defaultdict(float)  # name -> seconds
+        self.total = None
+
+    def add(self, section, seconds):
+        self.sections[section] += seconds
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+        return self.total
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total * 1000, 2),
+            'queries': self.queries,
+            **{f'{name}_ms': round(seconds * 1000, 2) for name, seconds in self.sections.items()},
+        }
+
+    def server_timing(self):
+        """Value for the Server-Timing response header"""
+        parts = [f'db;dur={self.sections["db"] * 1000:.1f};desc="{self.queries} queries"']
+        parts += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.sections.items() if name != 'db']
+        parts.append(f'total;dur={self.total * 1000:.1f}')
+        return ', '.join(parts)
+
+
+def current_metrics():
+    return _current.get()
+
+
+@contextmanager
+def collect(path=None):
+    """Collect metrics for the duration of one request"""
+    metrics = RequestMetrics(path)
+    metrics.sections['db'] = 0.0
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(section):
+    """Add the time spent in the block to ``section`` of the current request, if any"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.add(section, time.perf_counter() - started)
+
+
+def query_timer(execute, sql, params, many, context):
+    """Execute wrapper counting queries and database time; only inside ``collect()``"""
+    metrics = _current.get()
+    if metrics is None or _explaining.get():
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    succeeded = False
+    try:
+        result = execute(sql, params, many, context)
+        succeeded = True
+        return result
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.queries += 1
+        metrics.add('db', elapsed)
+        if succeeded and slow_queries.should_capture(elapsed):
+            slow_queries.capture(context['connection'], sql, params, many, elapsed, metrics.path)
+
+
+def install_query_timer(sender=None, connection=None, **kwargs):
+    """
+    ``connection_created`` receiver putting ``query_timer`` on every connection.
+    Connections are per thread, and under ASGI sync views and ``sync_to_async``
+    calls run on other threads than the middleware, so wrapping the middleware's
+    connection alone would miss their queries; the metrics context variable
+    follows the request into those threads.
+    """
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+def app_origin(limit=3):
+    """The innermost app frames (views, models, signals...) on the current stack"""
+    frames = []
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if not filename.startswith(APP_DIR) or filename == os.path.abspath(__file__):
+            continue
+        frames.append(f"{os.path.relpath(filename, os.path.dirname(APP_DIR))}:{frame.lineno} in {frame.name}")
+        if len(frames) == limit:
+            break
+    return frames
+
+
+class SlowQueryLog:
+    """Ring buffer of the most recent slow queries with their origin and EXPLAIN plan"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=getattr(settings, 'SLOW_QUERY_BUFFER_SIZE', 100))
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'SLOW_QUERY_CAPTURE', False)
+
+    def should_capture(self, elapsed):
+        return self.enabled and elapsed * 1000 >= getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 100)
+
+    def capture(self, connection, sql, params, many, elapsed, path=None):
+        entry = {
+            'captured_at': timezone.now(),
+            'duration_ms': round(elapsed * 1000, 2),
+            'path': path,
+            'sql': sql,
+            'params': repr(params)[:500],
+            'origin': app_origin(),
+            'plan': None if many else self.explain(connection, sql, params),
+        }
+        with self._lock:
+            self._entries.append(entry)
+
+    @staticmethod
+    def explain(connection, sql, params):
+        # Only plain reads are explained; EXPLAIN on writes is not worth the risk
+        if not sql.lstrip().upper().startswith('SELECT'):
+            return None
+        token = _explaining.set(True)
+        try:
+            # In its own savepoint: a failed EXPLAIN must not abort the request's transaction on PostgreSQL
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+                return '\n'.join(' '.join(str(col) for col in row) for row in cursor.fetchall())
+        except Exception as exc:
+            return f'EXPLAIN failed: {exc}'
+        finally:
+            _explaining.reset(token)
+
+    def entries(self):
+        """Newest first"""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_template_hook_installed = False
+
+
+def install_template_timing():
+    """Time every top-level template render (render(), render_to_string()) as 'template'"""
+    global _template_hook_installed
+    if _template_hook_installed:
+        return
+    from django.template.backends.django import Template
+
+    original_render = Template.render
+
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return original_render(self, context, request)
+
+    Template.render = render
+    _template_hook_installed = True
+
+
+class RollingStats:
+    """Last ``WINDOW_SIZE`` requests per view, shared by the threads of one worker process"""
+
+    def __init__(self, size=WINDOW_SIZE):
+        self._size = size
+        self._lock = threading.Lock()
+        self._records = {}
+
+    def record(self, view_name, record):
+        with self._lock:
+            if view_name not in self._records:
+                self._records[view_name] = deque(maxlen=self._size)
+            self._records[view_name].append(record)
+
+    def summary(self, limit=25):
+        """Slowest endpoints first, ranked by 95th percentile latency"""
+        with self._lock:
+            snapshot = {name: list(records) for name, records in self._records.items()}
+
+        rows = []
+        for view_name, records in snapshot.items():
+            totals = sorted(r['total_ms'] for r in records)
+            rows.append({
+                'view': view_name,
+                'roles': sorted({r['role'] for r in records}),
+                'count': len(records),
+                'avg_ms': round(sum(totals) / len(totals), 1),
+                'p95_ms': totals[min(len(totals) - 1, int(len(totals) * 0.95))],
+                'max_ms': totals[-1],
+                'avg_queries': round(sum(r['queries'] for r in records) / len(records), 1),
+                'avg_db_ms': round(sum(r.get('db_ms', 0) for r in records) / len(records), 1),
+                'avg_pdf_ms': round(sum(r.get('pdf_ms', 0) for r in records) / len(records), 1),
+            })
+        rows.sort(key=lambda row: row['p95_ms'], reverse=True)
+        return rows[:limit]
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+request_stats = RollingStats()
+slow_queries = SlowQueryLog()
@@ -0,0 +1,84 @@
+"""
+In-process background jobs.
+
+``run_in_background`` hands slow follow-up work (rescans, PDF rendering) to a
+small thread pool once the surrounding transaction has committed, so the
+request that triggered it returns straight away. Each job closes its own
+database connection when done. With ``BACKGROUND_JOBS_EAGER`` on (tests,
+management commands that need the result) jobs run inline instead.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# Keys of coalesced jobs that are queued but not started yet
+_queued = set()
+_queued_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BACKGROUND_JOB_WORKERS', 2),
+                thread_name_prefix='core-jobs',
+            )
+        return _executor
+
+
+def _run(func, args, kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        logger.exception("Background job %s failed", getattr(func, '__name__', func))
+        raise
+    finally:
+        # Worker threads get their own connections; don't leave them open between jobs
+        connections.close_all()
+
+
+def submit(func, *args, **kwargs):
+    """Run ``func`` on the job pool now; returns a Future"""
+    return get_executor().submit(_run, func, args, kwargs)
+
+
+def run_in_background(func, *args, **kwargs):
+    """Run ``func`` on the job pool after the current transaction commits"""
+    if getattr(settings, 'BACKGROUND_JOBS_EAGER', False):
+        transaction.on_commit(lambda: func(*args, **kwargs))
+        return
+    transaction.on_commit(lambda: submit(func, *args, **kwargs))
+
+
+def _start_coalesced(key, func, *args, **kwargs):
+    with _queued_lock:
+        _queued.discard(key)
+    return func(*args, **kwargs)
+
+
+def run_coalesced_in_background(key, func, *args, **kwargs):
+    """
+    ``run_in_background`` that drops the job while one with the same ``key`` is still
+    queued, e.g. one PDF render for a burst of autosaves. Once a job has started, the
+    next call queues a fresh one so the latest change is always picked up.
+    """
+    if getattr(settings, 'BACKGROUND_JOBS_EAGER', False):
+        transaction.on_commit(lambda: func(*args, **kwargs))
+        return
+
+    def enqueue():
+        with _queued_lock:
+            if key in _queued:
+                return
+            _queued.add(key)
+        submit(_start_coalesced, key, func, *args, **kwargs)
+    transaction.on_commit(enqueue)
@@ -0,0 +1,142 @@
+"""
+Cached id/name lookups of residents and staff per care home.
+
+The dropdowns on the log, incident and mapping forms only need ``id`` and a
+name for everyone in one or more care homes. Rows are read with ``.values_list()``
+and cached per care home and kind; ``core.signals`` drops the entry of a care
+home whenever a resident or staff member in it is saved or deleted. Each cached
+entry carries a digest of its rows, which makes up the response ETag.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import CustomUser, ServiceUser
+
+# kind -> (model with a ``carehome`` foreign key, cached columns)
+KINDS = {
+    'service_users': (ServiceUser, ('id', 'first_name', 'last_name')),
+    'staff': (CustomUser, ('id', 'first_name', 'last_name')),
+    'dob': (ServiceUser, ('id', 'dob')),
+}
+# Kinds served by the lookup API as id/name rows
+NAME_KINDS = ('service_users', 'staff')
+
+
+def _cache_key(kind, carehome_id):
+    return f'lookup:{kind}:{carehome_id}'
+
+
+def _timeout():
+    # Signals only clear the cache of the process that saved the row, the timeout bounds staleness elsewhere
+    return getattr(settings, 'LOOKUP_CACHE_TIMEOUT', 300)
+
+
+def parse_carehome_ids(values):
+    """Care home IDs from query values such as ``['1,2', '3']``; raises ValueError on junk"""
+    ids = set()
+    for value in values:
+        ids.update(int(part) for part in value.split(',') if part.strip())
+    return sorted(ids)
+
+
+def _rows_query(kind, carehome_ids):
+    model, columns = KINDS[kind]
+    return (model.objects.filter(carehome_id__in=carehome_ids)
+            .order_by(*columns[1:], 'id')
+            .values_list('carehome_id', *columns))
+
+
+def _build_entries(missing, rows):
+    loaded = {carehome_id: [] for carehome_id in missing}
+    for carehome_id, *row in rows:
+        loaded[carehome_id].append(tuple(row))
+    return {
+        carehome_id: {'digest': hashlib.md5(repr(rows).encode()).hexdigest(), 'rows': rows}
+        for carehome_id, rows in loaded.items()
+    }
+
+
+def _result(kind, carehome_ids, entries):
+    etag = hashlib.md5(
+        ';'.join(f"{carehome_id}:{entries[carehome_id]['digest']}" for carehome_id in carehome_ids).encode()
+    ).hexdigest()
+    return {carehome_id: entries[carehome_id]['rows'] for carehome_id in carehome_ids}, f'{kind}-{etag}'
+
+
+def get_rows(kind, carehome_ids):
+    """
+    Return ``({carehome_id: [row, ...]}, etag)`` with rows holding the kind's columns,
+    e.g. ``(id, first_name, last_name)``. Care homes missing from the cache are loaded
+    together in one query.
+    """
+    keys = {_cache_key(kind, carehome_id): carehome_id for carehome_id in carehome_ids}
+    entries = {keys[key]: entry for key, entry in cache.get_many(keys).items()}
+
+    missing = [carehome_id for carehome_id in carehome_ids if carehome_id not in entries]
+    if missing:
+        fresh = _build_entries(missing, _rows_query(kind, missing))
+        cache.set_many({_cache_key(kind, carehome_id): entry for carehome_id, entry in fresh.items()}, _timeout())
+        entries.update(fresh)
+    return _result(kind, carehome_ids, entries)
+
+
+async def aget_rows(kind, carehome_ids):
+    """``get_rows`` for async views, using the async cache and ORM APIs"""
+    keys = {_cache_key(kind, carehome_id): carehome_id for carehome_id in carehome_ids}
+    entries = {keys[key]: entry for key, entry in (await cache.aget_many(keys)).items()}
+
+    missing = [carehome_id for carehome_id in carehome_ids if carehome_id not in entries]
+    if missing:
+        fresh = _build_entries(missing, [row async for row in _rows_query(kind, missing)])
+        await cache.aset_many(
+            {_cache_key(kind, carehome_id): entry for carehome_id, entry in fresh.items()}, _timeout()
+        )
+        entries.update(fresh)
+    return _result(kind, carehome_ids, entries)
+
+
+def formatted_name(first_name, last_name):
+    """Same as ``ServiceUser.get_formatted_name`` without loading the model"""
+    initials = f"{first_name[:1]}{last_name[:1]}".upper()
+    return f"{first_name} {last_name} ({initials})"
+
+
+def flatten(rows_by_carehome, name=lambda first_name, last_name: f"{first_name} {last_name}"):
+    """``[{'id', 'name', 'carehome_id'}, ...]`` for all care homes, in the order they were requested"""
+    return [
+        {'id': pk, 'name': name(first_name, last_name), 'carehome_id': carehome_id}
+        for carehome_id, rows in rows_by_carehome.items()
+        for pk, first_name, last_name in rows
+    ]
+
+
+def _dob_map(rows):
+    return {
+        str(pk): dob.strftime('%Y-%m-%d')
+        for carehome_rows in rows.values()
+        for pk, dob in carehome_rows
+        if dob
+    }
+
+
+def get_dob_map(carehome_ids):
+    """``({service_user_id: 'YYYY-MM-DD'}, etag)`` for the residents of the given care homes"""
+    rows, etag = get_rows('dob', carehome_ids)
+    return _dob_map(rows), etag
+
+
+async def aget_dob_map(carehome_ids):
+    rows, etag = await aget_rows('dob', carehome_ids)
+    return _dob_map(rows), etag
+
+
+def invalidate(model, *carehome_ids):
+    """Drop every cached kind read from ``model`` for the given care homes"""
+    keys = [
+        _cache_key(kind, carehome_id)
+        for kind, (kind_model, _) in KINDS.items() if kind_model is model
+        for carehome_id in carehome_ids if carehome_id
+    ]
+    cache.delete_many(keys)
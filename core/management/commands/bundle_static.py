@@ -0,0 +1,49 @@
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+
+CSS_URL_RE = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+ABSOLUTE_PREFIXES = ('data:', 'http:', 'https:', '//', '/', '#')
+# Source map comments would point the bundle at maps that don't sit next to it, which
+# collectstatic's manifest storage refuses
+SOURCE_MAP_RE = re.compile(r'^[ \t]*(?://[#@] sourceMappingURL=\S*|/\*[#@] sourceMappingURL=[^*]*\*/)[ \t]*$',
+                           re.MULTILINE)
+
+
+def rebase_css_urls(css, source_dir, bundle_dir):
+    """Point relative ``url()``s of a stylesheet from ``source_dir`` at the same files from ``bundle_dir``"""
+    def rebase(match):
+        quote, url = match.groups()
+        if url.startswith(ABSOLUTE_PREFIXES):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        target = posixpath.normpath(posixpath.join(source_dir, path))
+        return f'url({quote}{posixpath.relpath(target, bundle_dir)}{suffix}{quote})'
+    return CSS_URL_RE.sub(rebase, css)
+
+
+class Command(BaseCommand):
+    help = 'Concatenates the STATIC_BUNDLES sources into one file each; run before collectstatic'
+
+    def handle(self, *args, **options):
+        os.makedirs(settings.STATIC_BUNDLES_DIR, exist_ok=True)
+        for name, sources in settings.STATIC_BUNDLES.items():
+            parts = []
+            for source in sources:
+                path = finders.find(source)
+                if path is None:
+                    raise CommandError(f"{name}: static file {source} not found")
+                with open(path, encoding='utf-8') as fh:
+                    content = SOURCE_MAP_RE.sub('', fh.read())
+                if name.endswith('.css'):
+                    content = rebase_css_urls(content, posixpath.dirname(source), 'bundles')
+                parts.append(f'/* {source} */\n{content.strip()}')
+            # A semicolon between scripts keeps one without a trailing one from running into the next
+            separator = '\n' if name.endswith('.css') else '\n;\n'
+            with open(os.path.join(settings.STATIC_BUNDLES_DIR, name), 'w', encoding='utf-8') as fh:
+                fh.write(separator.join(parts) + '\n')
+            self.stdout.write(f"Bundled {len(sources)} files into bundles/{name}")
@@ -0,0 +1,70 @@
+import csv
+import io
+import os
+import tempfile
+import zipfile
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.postcodes import PostcodeIndex, reset_index
+
+
+class Command(BaseCommand):
+    help = 'Builds the local postcode index from a CSV, ZIP of CSVs or plain list of postcodes (path or URL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='File path or http(s) URL, e.g. the ONS Postcode Directory')
+        parser.add_argument('--column', default='pcds',
+                            help='CSV column holding the postcode (ignored for one-per-line files)')
+        parser.add_argument('--output', default=None, help='Index file (default POSTCODE_INDEX_PATH)')
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.POSTCODE_INDEX_PATH
+        with tempfile.TemporaryDirectory() as workdir:
+            path = self.fetch(options['source'], workdir)
+            count = PostcodeIndex.write(self.read_postcodes(path, options['column']), output)
+        reset_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} postcodes in {output}"))
+
+    def fetch(self, source, workdir):
+        if not source.startswith(('http://', 'https://')):
+            if not os.path.exists(source):
+                raise CommandError(f"{source} does not exist")
+            return source
+        path = os.path.join(workdir, os.path.basename(source.split('?')[0]) or 'postcodes')
+        self.stdout.write(f"Downloading {source}")
+        with requests.get(source, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            with open(path, 'wb') as fh:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    fh.write(chunk)
+        return path
+
+    def read_postcodes(self, path, column):
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                for name in archive.namelist():
+                    if name.lower().endswith('.csv'):
+                        with archive.open(name) as fh:
+                            yield from self.read_text(io.TextIOWrapper(fh, encoding='utf-8-sig'), column)
+            return
+        with open(path, encoding='utf-8-sig', newline='') as fh:
+            yield from self.read_text(fh, column)
+
+    @staticmethod
+    def read_text(fh, column):
+        first = fh.readline()
+        if ',' not in first:
+            yield first
+            yield from fh
+            return
+        header = next(csv.reader([first]))
+        if column not in header:
+            # e.g. lookup tables inside the ONSPD archive
+            return
+        position = header.index(column)
+        for row in csv.reader(fh):
+            if len(row) > position:
+                yield row[position]
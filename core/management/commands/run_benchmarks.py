@@ -0,0 +1,103 @@
+import json
+import platform
+import tempfile
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from core import rendering
+from core.benchmarks import SCENARIOS, BenchmarkContext, compare_results, connection_settings, run_scenario
+from core.models import LogEntry, LatestLogEntry, MissedLog
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the hot views and PDF renderers against the current database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='benchmark_results.json', help='Where to write the JSON results')
+        parser.add_argument('--iterations', type=int, default=5, help='Timed runs per scenario')
+        parser.add_argument('--only', nargs='*', default=None, help='Scenario names to run')
+        parser.add_argument('--group', default=None, help='Only run scenarios in this group (e.g. views, pdf, pdf_engines, connections)')
+        parser.add_argument('--compare', default=None, help='Previous results file to check for regressions')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative growth in wall time and memory before flagging')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error when a regression is found')
+
+    def handle(self, *args, **options):
+        scenarios = [
+            s for s in SCENARIOS.values()
+            if (options['only'] is None or s.name in options['only'])
+            and (options['group'] is None or s.group == options['group'])
+        ]
+        if not scenarios:
+            raise CommandError('No scenarios selected')
+
+        # Allows the test client's host and keeps generated PDFs out of the real media folder.
+        # Static URLs are resolved without the collectstatic manifest, which may not exist here.
+        storages = {**settings.STORAGES, 'staticfiles': {
+            'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+        }}
+        setup_test_environment()
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root, STORAGES=storages):
+                ctx = BenchmarkContext()
+                missing = ctx.missing()
+                if missing:
+                    raise CommandError(
+                        f"Database is missing {', '.join(missing)}; seed it first with manage.py seed_scale"
+                    )
+                results = {}
+                for item in scenarios:
+                    results[item.name] = run_scenario(item, ctx, iterations=options['iterations'])
+                    self.report(item.name, results[item.name])
+        finally:
+            teardown_test_environment()
+
+        payload = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'connections': connection_settings(),
+                # Peak RSS of the PDF workers; tracemalloc above only sees this process
+                'pdf_rendering': {
+                    'workers': getattr(settings, 'PDF_RENDER_WORKERS', 0),
+                    'documents': rendering.render_stats.summary(),
+                },
+                'rows': {
+                    'log_entries': LogEntry.objects.count(),
+                    'latest_logs': LatestLogEntry.objects.count(),
+                    'missed_logs': MissedLog.objects.count(),
+                },
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as fh:
+            json.dump(payload, fh, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if options['compare']:
+            with open(options['compare']) as fh:
+                baseline = json.load(fh)['results']
+            regressions = compare_results(results, baseline, tolerance=options['tolerance'])
+            for line in regressions:
+                self.stdout.write(self.style.WARNING(f"REGRESSION {line}"))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
+            elif options['fail_on_regression']:
+                raise CommandError(f'{len(regressions)} regression(s) found')
+
+    def report(self, name, result):
+        line = (f"{name:<36} {result['wall_ms']['median']:>9.2f}ms  "
+                f"{result['queries']:>4} queries  {result['peak_kb']:>9.1f}KB peak")
+        if result['status'] and result['status'] >= 400:
+            self.stdout.write(self.style.ERROR(f"{line}  (HTTP {result['status']})"))
+        else:
+            self.stdout.write(line)
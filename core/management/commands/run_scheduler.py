@@ -0,0 +1,36 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from core.scheduler import JOBS, run_due_jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs the periodic jobs (missed-log checks, PDF backfill, cleanup) as they fall due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the due jobs once and exit')
+        parser.add_argument('--interval', type=float, default=30, help='Seconds between checks for due jobs')
+        parser.add_argument('--job', action='append', dest='jobs', choices=sorted(JOBS),
+                            help='Only run this job (repeatable)')
+        parser.add_argument('--force', action='store_true', help='Run the selected jobs even if not due')
+
+    def handle(self, *args, **options):
+        if options['force'] and not options['once']:
+            raise CommandError('--force only makes sense with --once')
+
+        stopping = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stopping.set())
+
+        while not stopping.is_set():
+            close_old_connections()
+            for name in run_due_jobs(options['jobs'], force=options['force']):
+                self.stdout.write(f"Ran {name}")
+            if options['once']:
+                break
+            stopping.wait(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS("Scheduler stopped"))
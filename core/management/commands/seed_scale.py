@@ -0,0 +1,285 @@
+import random
+import time as clock
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import (
+    CareHome, ServiceUser, CustomUser, Mapping, LatestLogEntry, LogEntry, ABCForm, IncidentReport, MissedLog,
+    ShiftCoverage,
+)
+
+SEED_DOMAIN = 'seed.example.com'
+SEED_CAREHOME_PREFIX = '[seed] '
+
+FIRST_NAMES = [
+    'Amelia', 'Oliver', 'Isla', 'George', 'Ava', 'Noah', 'Mia', 'Arthur', 'Ivy', 'Leo',
+    'Freya', 'Oscar', 'Lily', 'Harry', 'Grace', 'Jack', 'Sophia', 'Charlie', 'Ella', 'Thomas',
+]
+LAST_NAMES = [
+    'Smith', 'Jones', 'Taylor', 'Brown', 'Williams', 'Wilson', 'Johnson', 'Davies', 'Patel', 'Wright',
+    'Walker', 'Evans', 'Roberts', 'Green', 'Hall', 'Wood', 'Clarke', 'Khan', 'Hughes', 'Edwards',
+]
+POSTCODES = ['M1 1AE', 'SW1A 1AA', 'LS1 4AP', 'B33 8TH', 'CR2 6XH', 'DN55 1PT', 'EH1 1YZ', 'L1 8JQ']
+LOG_PHRASES = [
+    'Settled and watching television in the lounge.',
+    'Had breakfast, ate well and took fluids.',
+    'Asleep, checked hourly, no concerns.',
+    'Went for a short walk with support.',
+    'Took medication as prescribed.',
+    'Engaged in an art activity with peers.',
+    'Personal care completed, mood appeared positive.',
+    'Telephone call with family, presented happy afterwards.',
+    'Appeared restless, reassurance given and settled.',
+    '',
+]
+LOCATIONS = ['Lounge', 'Kitchen', 'Bedroom', 'Garden', 'Dining room', 'Community']
+BEHAVIOURS = [choice for choice, _ in ABCForm.TARGET_BEHAVIOUR_CHOICES]
+
+SHIFT_SLOTS = 12
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the historical values set on auto_now/auto_now_add fields."""
+    toggled = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                toggled.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in toggled:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Generates a deterministic, production-sized dataset for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carehomes', type=int, default=5, help='Number of care homes to create')
+        parser.add_argument('--residents', type=int, default=12, help='Service users per care home')
+        parser.add_argument('--staff', type=int, default=8, help='Staff members per care home')
+        parser.add_argument('--months', type=int, default=6, help='Months of shift history to generate')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create call')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, so runs are reproducible')
+        parser.add_argument('--missed-rate', type=float, default=0.03,
+                            help='Fraction of shifts left without a log (recorded as missed)')
+        parser.add_argument('--clear', action='store_true', help='Delete previously seeded data first')
+
+    def handle(self, *args, **options):
+        if min(options['carehomes'], options['residents'], options['staff'], options['months']) < 1:
+            raise CommandError('--carehomes, --residents, --staff and --months must all be at least 1')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.missed_rate = options['missed_rate']
+        self.password = make_password('seed-password')
+        self.today = timezone.localdate()
+        self.start_date = self.today - timedelta(days=30 * options['months'])
+        self.counts = dict.fromkeys(['logs', 'entries', 'missed', 'abc', 'incidents'], 0)
+
+        if options['clear']:
+            self.clear()
+        elif CareHome.objects.filter(name__startswith=SEED_CAREHOME_PREFIX).exists():
+            raise CommandError('Seed data already exists, re-run with --clear to replace it')
+
+        started = clock.monotonic()
+        models = (CareHome, ServiceUser, CustomUser, Mapping, LatestLogEntry, LogEntry, ABCForm, MissedLog)
+        with explicit_timestamps(*models):
+            manager = self.create_manager()
+            for index in range(options['carehomes']):
+                with transaction.atomic():
+                    self.seed_carehome(index, manager, options['residents'], options['staff'])
+                self.stdout.write(f"Seeded care home {index + 1}/{options['carehomes']}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {self.counts['logs']} shift logs, {self.counts['entries']} log entries, "
+            f"{self.counts['missed']} missed shifts, {self.counts['abc']} ABC forms and "
+            f"{self.counts['incidents']} incident reports in {clock.monotonic() - started:.1f}s"
+        ))
+
+    def clear(self):
+        # Cascades remove residents, logs, forms and missed shifts along with the care homes
+        CareHome.objects.filter(name__startswith=SEED_CAREHOME_PREFIX).delete()
+        CustomUser.objects.filter(email__endswith=f'@{SEED_DOMAIN}').delete()
+
+    def bulk_create(self, model, objs):
+        return model.objects.bulk_create(objs, batch_size=self.batch_size)
+
+    def aware(self, day, at):
+        return timezone.make_aware(datetime.combine(day, at))
+
+    def person(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    def create_manager(self):
+        joined = self.aware(self.start_date, time(9, 0))
+        return CustomUser.objects.create(
+            email=f'manager@{SEED_DOMAIN}', first_name='Seed', last_name='Manager', password=self.password,
+            role=CustomUser.Manager, is_staff=True, date_joined=joined,
+        )
+
+    def seed_carehome(self, index, manager, resident_count, staff_count):
+        rng = self.rng
+        opened = self.aware(self.start_date, time(9, 0))
+        start_hour = rng.choice([7, 8, 9])
+        carehome = CareHome.objects.create(
+            name=f'{SEED_CAREHOME_PREFIX}Care Home {index + 1}',
+            postcode=rng.choice(POSTCODES),
+            morning_shift_start=time(start_hour, 0),
+            morning_shift_end=time(start_hour + 12, 0),
+            night_shift_start=time(start_hour + 12, 0),
+            night_shift_end=time(start_hour, 0),
+            created_at=opened,
+            updated_at=opened,
+        )
+
+        staff = []
+        for number in range(staff_count + 1):
+            first_name, last_name = self.person()
+            role = CustomUser.TEAM_LEAD if number == 0 else CustomUser.STAFF
+            staff.append(CustomUser(
+                email=f'{role}{index + 1}_{number}@{SEED_DOMAIN}', first_name=first_name, last_name=last_name,
+                password=self.password, role=role, carehome=carehome, is_staff=role == CustomUser.TEAM_LEAD,
+                date_joined=opened,
+            ))
+        staff = self.bulk_create(CustomUser, staff)
+        team_lead, carers = staff[0], staff[1:]
+        carehome.managers.add(manager, team_lead)
+
+        residents = []
+        for _ in range(resident_count):
+            first_name, last_name = self.person()
+            residents.append(ServiceUser(
+                carehome=carehome, first_name=first_name, last_name=last_name,
+                dob=self.today - timedelta(days=rng.randint(20 * 365, 90 * 365)),
+                phone=f'07{rng.randint(100, 999)} {rng.randint(100, 999)} {rng.randint(100, 999)}',
+                emergency_contact=f'07{rng.randint(100000000, 999999999)}',
+                address=f'{rng.randint(1, 200)} High Street', created_at=opened,
+            ))
+        residents = self.bulk_create(ServiceUser, residents)
+
+        self.seed_mappings(carers, carehome, residents, opened)
+        self.seed_shift_logs(carehome, carers, residents)
+        self.seed_forms(carehome, carers, residents)
+
+    def seed_mappings(self, carers, carehome, residents, created_at):
+        mappings = self.bulk_create(Mapping, [Mapping(staff=carer, created_at=created_at) for carer in carers])
+        home_links, resident_links = [], []
+        for mapping in mappings:
+            home_links.append(Mapping.carehomes.through(mapping_id=mapping.pk, carehome_id=carehome.pk))
+            for resident in self.rng.sample(residents, k=max(1, len(residents) // 3)):
+                resident_links.append(Mapping.service_users.through(mapping_id=mapping.pk,
+                                                                    serviceuser_id=resident.pk))
+        self.bulk_create(Mapping.carehomes.through, home_links)
+        self.bulk_create(Mapping.service_users.through, resident_links)
+
+    def seed_shift_logs(self, carehome, carers, residents):
+        shifts = [
+            ('morning', carehome.morning_shift_start),
+            ('night', carehome.night_shift_start),
+        ]
+        pending, missed, coverage = [], [], []
+        day = self.start_date
+        while day < self.today:
+            for resident in residents:
+                logged = 0
+                for shift, start in shifts:
+                    if self.rng.random() < self.missed_rate:
+                        resolved = self.aware(day + timedelta(days=1), time(12, 0)) \
+                            if self.rng.random() < 0.3 else None
+                        missed.append(MissedLog(
+                            carehome=carehome, service_user=resident, date=day, shift=shift,
+                            created_at=self.aware(day + timedelta(days=1), start), resolved_at=resolved,
+                        ))
+                        continue
+                    carer = self.rng.choice(carers)
+                    stamp = self.aware(day, start)
+                    logged |= ShiftCoverage.SHIFT_FLAGS[shift]
+                    pending.append(LatestLogEntry(
+                        user=carer, carehome=carehome, service_user=resident, shift=shift, date=day,
+                        staff_name=carer.get_full_name(), day_of_week=day.strftime('%A'), status='locked',
+                        created_at=stamp, updated_at=stamp + timedelta(hours=SHIFT_SLOTS),
+                    ))
+                if logged:
+                    coverage.append(ShiftCoverage(
+                        service_user=resident, carehome=carehome, date=day, shifts_logged=logged,
+                    ))
+            if len(pending) >= self.batch_size:
+                self.flush_shift_logs(pending, start_times=dict(shifts))
+                pending = []
+            day += timedelta(days=1)
+
+        if pending:
+            self.flush_shift_logs(pending, start_times=dict(shifts))
+        self.bulk_create(MissedLog, missed)
+        self.bulk_create(ShiftCoverage, coverage)
+        self.counts['missed'] += len(missed)
+
+    def flush_shift_logs(self, latest_logs, start_times):
+        latest_logs = self.bulk_create(LatestLogEntry, latest_logs)
+        entries = []
+        for latest_log in latest_logs:
+            first_hour = start_times[latest_log.shift].hour
+            for slot in range(SHIFT_SLOTS):
+                entries.append(LogEntry(
+                    user_id=latest_log.user_id, carehome_id=latest_log.carehome_id,
+                    service_user_id=latest_log.service_user_id, shift=latest_log.shift, date=latest_log.date,
+                    time_slot=time((first_hour + slot) % 24, 0), content=self.rng.choice(LOG_PHRASES),
+                    latest_log=latest_log, is_locked=True,
+                ))
+            if len(entries) >= self.batch_size:
+                self.bulk_create(LogEntry, entries)
+                self.counts['entries'] += len(entries)
+                entries = []
+        self.bulk_create(LogEntry, entries)
+        self.counts['entries'] += len(entries)
+        self.counts['logs'] += len(latest_logs)
+
+    def seed_forms(self, carehome, carers, residents):
+        rng = self.rng
+        history_days = (self.today - self.start_date).days
+        months = max(1, history_days // 30)
+        abc_forms, incidents = [], []
+        for resident in residents:
+            for _ in range(rng.randint(0, 2 * months)):
+                carer = rng.choice(carers)
+                happened = self.aware(self.start_date + timedelta(days=rng.randrange(history_days)),
+                                      time(rng.randint(0, 23), rng.choice([0, 15, 30, 45])))
+                abc_forms.append(ABCForm(
+                    created_by=carer, staff=carer.get_full_name(), service_user=resident,
+                    date_of_birth=resident.dob, date_time=happened,
+                    target_behaviours=rng.sample(BEHAVIOURS, k=rng.randint(1, 3)),
+                    setting_location=rng.choice(LOCATIONS), setting_present=carer.get_full_name(),
+                    setting_activity="Lunch time", setting_environment="Busy and noisy",
+                    antecedent_description="Asked to wait for a drink",
+                    antecedent_change=rng.choice(['yes', 'no']), antecedent_noise=rng.choice(['yes', 'no']),
+                    antecedent_waiting="Drink",
+                    behaviour_description="Shouted and pushed a chair",
+                    consequence_immediate="Staff offered space and reassurance",
+                    reflection_learnings="Offer drinks before lunch is served",
+                    created_at=happened, updated_at=happened,
+                ))
+            for _ in range(rng.randint(0, months)):
+                carer = rng.choice(carers)
+                happened = self.aware(self.start_date + timedelta(days=rng.randrange(history_days)),
+                                      time(rng.randint(0, 23), rng.choice([0, 15, 30, 45])))
+                incidents.append(IncidentReport(
+                    staff=carer, service_user=resident, carehome=carehome, incident_datetime=happened,
+                    location=rng.choice(LOCATIONS), dob=resident.dob, staff_involved=carer.get_full_name(),
+                    prior_description='Resident was settled before the incident.',
+                    incident_description='Resident became distressed and threw a cup.',
+                    user_response='Calmed after support from staff.',
+                    contacted_manager=rng.random() < 0.5,
+                ))
+        self.bulk_create(ABCForm, abc_forms)
+        self.bulk_create(IncidentReport, incidents)
+        self.counts['abc'] += len(abc_forms)
+        self.counts['incidents'] += len(incidents)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.notifications import send_missed_log_digests
+
+
+class Command(BaseCommand):
+    help = 'Emails team leads and managers a digest of the missed shift logs of their care homes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Missed logs claimed per batch')
+
+    def handle(self, *args, **options):
+        sent, covered = send_missed_log_digests(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} digests covering {covered} missed logs"))
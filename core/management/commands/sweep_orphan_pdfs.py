@@ -0,0 +1,25 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from core.pdf_storage import orphaned_files
+
+
+class Command(BaseCommand):
+    help = 'Deletes generated PDFs (and leftover temporary files) that no shift log, ABC form or incident report uses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list what would be deleted')
+        parser.add_argument('--min-age', type=int, default=60,
+                            help='Minutes since a file was last written or reused before it can be deleted')
+
+    def handle(self, *args, **options):
+        count = size = 0
+        for name, file_size in orphaned_files(min_age=options['min_age'] * 60):
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                default_storage.delete(name)
+            count += 1
+            size += file_size
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {count} orphaned files ({size / 1024 / 1024:.1f} MB)"))
@@ -1,15 +1,146 @@
+import json
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .access import get_scope
+from .instrumentation import collect, install_template_timing, request_stats
 from .models import CustomUser
 
+performance_logger = logging.getLogger('core.performance')
+
+
+class SyncAndAsyncMiddleware:
+    """
+    Base for middleware that runs natively under both WSGI and ASGI, so async views
+    aren't pushed back onto a thread. Subclasses implement ``__call__`` and ``__acall__``.
+    """
+    sync_capable = True
+    async_capable = True
 
-class UpdateLastActiveMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise that stays async under ASGI: the static file table is in memory, only misses go on"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
 
+
+class UpdateLastActiveMiddleware(SyncAndAsyncMiddleware):
     def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
         response = self.get_response(request)
 
         if request.user.is_authenticated and isinstance(request.user, CustomUser):
             CustomUser.objects.filter(pk=request.user.pk).update(last_active=timezone.now())
 
-        return response
\ No newline at end of file
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+
+        user = await request.auser()
+        if user.is_authenticated and isinstance(user, CustomUser):
+            await CustomUser.objects.filter(pk=user.pk).aupdate(last_active=timezone.now())
+
+        return response
+
+
+class AccessScopeMiddleware(SyncAndAsyncMiddleware):
+    """Sets ``request.access``, resolved on first use so anonymous and static requests pay nothing"""
+
+    def __call__(self, request):
+        # Sync views only; async views call ``core.access.aget_scope``
+        request.access = SimpleLazyObject(lambda: get_scope(request.user))
+        # Returns the coroutine as is under ASGI
+        return self.get_response(request)
+
+
+class PerformanceMiddleware(SyncAndAsyncMiddleware):
+    """
+    Records query count/time, template and PDF render time and total latency per request.
+    Adds a Server-Timing header, logs slow requests as JSON and feeds the admin summary.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.enabled = getattr(settings, 'PERFORMANCE_INSTRUMENTATION', True)
+        self.slow_ms = getattr(settings, 'PERFORMANCE_SLOW_REQUEST_MS', 1000)
+        if self.enabled:
+            install_template_timing()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        with collect(request.path) as metrics:
+            response = self.get_response(request)
+        return self.finish(request, response, metrics, getattr(request, 'user', None))
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        # The metrics are context-local, so queries run by sync views and sync_to_async count too
+        with collect(request.path) as metrics:
+            response = await self.get_response(request)
+        # request.user would load the user synchronously here
+        user = await request.auser() if hasattr(request, 'auser') else None
+        return self.finish(request, response, metrics, user)
+
+    def finish(self, request, response, metrics, user):
+        metrics.finish()
+
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'view': match.view_name if match else request.path,
+            'role': self.get_role(user),
+            'method': request.method,
+            'status': response.status_code,
+            **metrics.as_dict(),
+        }
+        request_stats.record(record['view'], record)
+        response['Server-Timing'] = metrics.server_timing()
+
+        if record['total_ms'] >= self.slow_ms:
+            performance_logger.warning(json.dumps({'event': 'slow_request', 'path': request.path, **record}))
+        return response
+
+    @staticmethod
+    def get_role(user):
+        if user is None or not user.is_authenticated:
+            return 'anonymous'
+        if user.is_superuser:
+            return 'superuser'
+        return getattr(user, 'role', 'user')
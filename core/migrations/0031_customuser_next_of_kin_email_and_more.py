@@ -0,0 +1,81 @@
+# Generated by Django 5.2.1 on 2026-10-19 18:51
+
+from django.db import migrations, models
+
+
+class AddFieldIfMissing(migrations.AddField):
+    """
+    These fields were on the models before any migration added them, so some
+    databases already have the columns: only add the ones that are missing.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        connection = schema_editor.connection
+        with connection.cursor() as cursor:
+            columns = {
+                column.name
+                for column in connection.introspection.get_table_description(cursor, model._meta.db_table)
+            }
+        if model._meta.get_field(self.name).column not in columns:
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_alter_missedlog_options_and_more'),
+    ]
+
+    operations = [
+        AddFieldIfMissing(
+            model_name='customuser',
+            name='next_of_kin_email',
+            field=models.EmailField(blank=True, max_length=254, null=True),
+        ),
+        AddFieldIfMissing(
+            model_name='customuser',
+            name='next_of_kin_first_name',
+            field=models.CharField(blank=True, max_length=30, null=True),
+        ),
+        AddFieldIfMissing(
+            model_name='customuser',
+            name='next_of_kin_last_name',
+            field=models.CharField(blank=True, max_length=30, null=True),
+        ),
+        AddFieldIfMissing(
+            model_name='customuser',
+            name='next_of_kin_phone',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        AddFieldIfMissing(
+            model_name='customuser',
+            name='postcode',
+            field=models.CharField(blank=True, max_length=10, null=True),
+        ),
+        AddFieldIfMissing(
+            model_name='serviceuser',
+            name='dob',
+            field=models.DateField(blank=True, null=True),
+        ),
+        AddFieldIfMissing(
+            model_name='serviceuser',
+            name='next_of_kin_email',
+            field=models.EmailField(blank=True, max_length=254, null=True),
+        ),
+        AddFieldIfMissing(
+            model_name='serviceuser',
+            name='next_of_kin_first_name',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        AddFieldIfMissing(
+            model_name='serviceuser',
+            name='next_of_kin_last_name',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        AddFieldIfMissing(
+            model_name='serviceuser',
+            name='next_of_kin_phone',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+    ]
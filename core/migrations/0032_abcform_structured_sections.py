@@ -0,0 +1,77 @@
+# Generated by Django 5.2.1 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0031_customuser_next_of_kin_email_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="abcform",
+            name="setting_location",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="abcform",
+            name="setting_present",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="abcform",
+            name="setting_activity",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="abcform",
+            name="setting_environment",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="abcform",
+            name="antecedent_description",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="abcform",
+            name="antecedent_change",
+            field=models.CharField(
+                choices=[("yes", "Yes"), ("no", "No")],
+                db_index=True,
+                default="no",
+                max_length=3,
+            ),
+        ),
+        migrations.AddField(
+            model_name="abcform",
+            name="antecedent_noise",
+            field=models.CharField(
+                choices=[("yes", "Yes"), ("no", "No")],
+                db_index=True,
+                default="no",
+                max_length=3,
+            ),
+        ),
+        migrations.AddField(
+            model_name="abcform",
+            name="antecedent_waiting",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="abcform",
+            name="behaviour_description",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="abcform",
+            name="consequence_immediate",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="abcform",
+            name="reflection_learnings",
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.1 on 2026-10-19 09:13
+#
+# Kept apart from the schema changes on either side: PostgreSQL refuses to ALTER a
+# table in the same transaction that updated its rows while FK checks are pending.
+
+from django.db import migrations
+
+# legacy text column -> [(line label, new column)]
+SECTIONS = {
+    "setting": [
+        ("Location", "setting_location"),
+        ("Present", "setting_present"),
+        ("Activity", "setting_activity"),
+        ("Environment", "setting_environment"),
+    ],
+    "antecedent": [
+        ("Description", "antecedent_description"),
+        ("Routine change", "antecedent_change"),
+        ("Unexpected noise", "antecedent_noise"),
+        ("Waiting for", "antecedent_waiting"),
+    ],
+    "behaviour": [("Description", "behaviour_description")],
+    "consequences": [("Immediate", "consequence_immediate")],
+    "reflection": [("Learnings", "reflection_learnings")],
+}
+YES_NO_COLUMNS = {"antecedent_change", "antecedent_noise"}
+SHORT_COLUMNS = {"setting_location", "setting_present", "antecedent_waiting"}
+
+
+def parse_lines(text, labels):
+    """
+    Values of the 'Label: value' lines written by the old form. Free text could span
+    several lines, so only the section's own labels start a new value.
+    """
+    values, current = {}, None
+    for line in (text or "").split("\n"):
+        label, sep, rest = line.partition(":")
+        if sep and label.strip() in labels and label.strip() not in values:
+            current = label.strip()
+            values[current] = rest.strip()
+        elif current is not None:
+            values[current] = f"{values[current]}\n{line}".strip()
+    return values
+
+
+def split_text(apps, schema_editor):
+    ABCForm = apps.get_model("core", "ABCForm")
+    columns = [column for pairs in SECTIONS.values() for _, column in pairs]
+    batch = []
+    for form in ABCForm.objects.only("id", *SECTIONS).iterator(chunk_size=500):
+        for legacy, pairs in SECTIONS.items():
+            values = parse_lines(getattr(form, legacy), {label for label, _ in pairs})
+            for label, column in pairs:
+                value = values.get(label, "")
+                if column in YES_NO_COLUMNS:
+                    value = "yes" if value.lower() == "yes" else "no"
+                elif column in SHORT_COLUMNS:
+                    value = value[:255]
+                setattr(form, column, value)
+        batch.append(form)
+        if len(batch) == 500:
+            ABCForm.objects.bulk_update(batch, columns)
+            batch = []
+    if batch:
+        ABCForm.objects.bulk_update(batch, columns)
+
+
+def join_text(apps, schema_editor):
+    ABCForm = apps.get_model("core", "ABCForm")
+    batch = []
+    for form in ABCForm.objects.iterator(chunk_size=500):
+        for legacy, pairs in SECTIONS.items():
+            setattr(form, legacy, "\n".join(f"{label}: {getattr(form, column)}" for label, column in pairs))
+        batch.append(form)
+        if len(batch) == 500:
+            ABCForm.objects.bulk_update(batch, list(SECTIONS))
+            batch = []
+    if batch:
+        ABCForm.objects.bulk_update(batch, list(SECTIONS))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0032_abcform_structured_sections"),
+    ]
+
+    operations = [
+        migrations.RunPython(split_text, join_text),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-19 09:14
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0033_abcform_split_section_text"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="abcform",
+            name="setting",
+        ),
+        migrations.RemoveField(
+            model_name="abcform",
+            name="antecedent",
+        ),
+        migrations.RemoveField(
+            model_name="abcform",
+            name="behaviour",
+        ),
+        migrations.RemoveField(
+            model_name="abcform",
+            name="consequences",
+        ),
+        migrations.RemoveField(
+            model_name="abcform",
+            name="reflection",
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-19 10:02
+
+from django.db import migrations, models
+
+GIN_INDEX = "core_abcform_target_behaviours_gin"
+
+
+def create_gin_index(apps, schema_editor):
+    # jsonb containment (@>) is PostgreSQL only; other backends filter on the JSON text instead
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {GIN_INDEX} "
+        "ON core_abcform USING gin (target_behaviours jsonb_path_ops)"
+    )
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {GIN_INDEX}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0034_remove_abcform_legacy_text"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="abcform",
+            index=models.Index(fields=["date_time"], name="core_abcform_date_time_idx"),
+        ),
+        migrations.RunPython(create_gin_index, drop_gin_index),
+    ]
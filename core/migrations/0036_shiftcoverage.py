@@ -0,0 +1,81 @@
+# Generated by Django 5.2.1 on 2026-10-19 10:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+SHIFT_FLAGS = {"morning": 1, "night": 2}
+BATCH_SIZE = 2000
+
+
+def backfill(apps, schema_editor):
+    """One coverage row per (service user, date) from the existing shift logs"""
+    LatestLogEntry = apps.get_model("core", "LatestLogEntry")
+    ShiftCoverage = apps.get_model("core", "ShiftCoverage")
+
+    rows = (
+        LatestLogEntry.objects.order_by("service_user_id", "date")
+        .values_list("service_user_id", "date", "carehome_id", "shift")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    batch, current = [], None
+    for service_user_id, date, carehome_id, shift in rows:
+        if current is None or (current.service_user_id, current.date) != (service_user_id, date):
+            current = ShiftCoverage(service_user_id=service_user_id, date=date, carehome_id=carehome_id)
+            batch.append(current)
+        current.shifts_logged |= SHIFT_FLAGS.get(shift, 0)
+        if len(batch) > BATCH_SIZE:
+            # Keep the row still being filled for the next batch
+            ShiftCoverage.objects.bulk_create(batch[:-1], ignore_conflicts=True)
+            batch = batch[-1:]
+    ShiftCoverage.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0035_abcform_behaviour_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShiftCoverage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("shifts_logged", models.PositiveSmallIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "carehome",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shift_coverage",
+                        to="core.carehome",
+                    ),
+                ),
+                (
+                    "service_user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shift_coverage",
+                        to="core.serviceuser",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("service_user", "date"),
+                        name="core_shiftcoverage_unique_day",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0037_scheduledjobrun"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="missedlog",
+            index=models.Index(
+                fields=["resolved_at", "date"], name="core_missedlog_unresolved_idx"
+            ),
+        ),
+    ]
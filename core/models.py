@@ -3,21 +3,20 @@ import os
 from django.core.exceptions import ValidationError
 from django.db.models.signals import pre_save, post_delete
 from django.dispatch import receiver
-from django.template.loader import render_to_string
 from django.utils import timezone
 from datetime import timedelta
 
 from django.contrib.auth.base_user import AbstractBaseUser
-from django.db import models, transaction
+from django.db import connection, models, transaction
 from django.contrib.auth.models import AbstractUser, Group, Permission, PermissionsMixin
 from django.core.validators import RegexValidator
 
 from django.contrib.auth.base_user import BaseUserManager
 
 from django.db import models
-from weasyprint import HTML
 
-from carehome_project import settings
+from django.conf import settings
+from . import pdf_storage, rendering
 
 
 class CareHome(models.Model):
@@ -62,12 +61,19 @@ class CareHome(models.Model):
     def get_staff_members(self):
         return self.customuser_set.filter(role='staff')
 
+    SHIFT_TIME_FIELDS = ('morning_shift_start', 'morning_shift_end', 'night_shift_start', 'night_shift_end')
+
     def save(self, *args, **kwargs):
+        # Read by the post_save signal: only a change of shift times needs a missed-log rescan
+        self._shift_times_changed = False
         if self.pk:
             try:
                 old = CareHome.objects.get(pk=self.pk)
                 if old.picture != self.picture:
                     old.picture.delete(save=False)
+                self._shift_times_changed = any(
+                    getattr(old, field) != getattr(self, field) for field in self.SHIFT_TIME_FIELDS
+                )
             except CareHome.DoesNotExist:
                 pass
         super().save(*args, **kwargs)
@@ -76,48 +82,29 @@ class CareHome(models.Model):
         self.picture.delete(save=False)
         super().delete(*args, **kwargs)
 
-    def check_missed_logs(self, date=None):
+    def check_missed_logs(self, date=None, shifts=('morning', 'night')):
         """
         Check for service users who don't have shift logs for the given date
-        Only checks morning and night shifts
+        Only checks morning and night shifts, or the ones in ``shifts``
         """
         if date is None:
             date = timezone.now().date()
 
-        missed_logs = []
-
-        for service_user in self.service_users.all():
-            # Check morning shift
-            if not LatestLogEntry.objects.filter(
-                    carehome=self,
-                    service_user=service_user,
-                    date=date,
-                    shift='morning'
-            ).exists():
-                missed_logs.append(
-                    MissedLog(
-                        carehome=self,
-                        service_user=service_user,
-                        date=date,
-                        shift='morning'
-                    )
-                )
-
-            # Check night shift (not afternoon!)
-            if not LatestLogEntry.objects.filter(
-                    carehome=self,
-                    service_user=service_user,
-                    date=date,
-                    shift='night'
-            ).exists():
-                missed_logs.append(
-                    MissedLog(
-                        carehome=self,
-                        service_user=service_user,
-                        date=date,
-                        shift='night'
-                    )
-                )
+        # One query for the day's coverage instead of two exists() per resident
+        covered = dict(
+            ShiftCoverage.objects.filter(carehome=self, date=date).values_list('service_user_id', 'shifts_logged')
+        )
+        # Safe to run again for the same day
+        recorded = set(
+            MissedLog.objects.filter(carehome=self, date=date).values_list('service_user_id', 'shift')
+        )
+        missed_logs = [
+            MissedLog(carehome=self, service_user_id=service_user_id, date=date, shift=shift)
+            for service_user_id in self.service_users.values_list('id', flat=True)
+            for shift in shifts
+            if not covered.get(service_user_id, 0) & ShiftCoverage.SHIFT_FLAGS[shift]
+            and (service_user_id, shift) not in recorded
+        ]
 
         # Bulk create missed logs, ignoring duplicates
         MissedLog.objects.bulk_create(
@@ -131,6 +118,33 @@ class CareHome(models.Model):
             resolved_at__isnull=True
         )
 
+    def flag_unlogged_shifts(self, days=180):
+        """
+        Record today's missed log for every resident and shift without a completed log in
+        the last ``days`` days, skipping ones already recorded. One aggregate query.
+        """
+        today = timezone.now().date()
+        since = today - timedelta(days=days)
+        residents = self.service_users.all()
+        for shift in ('morning', 'night'):
+            residents = residents.annotate(**{
+                f'{shift}_logged': models.Exists(LatestLogEntry.objects.filter(
+                    service_user=models.OuterRef('pk'), shift=shift, date__gte=since,
+                    status__in=['complete', 'locked'],
+                )),
+                f'{shift}_flagged': models.Exists(MissedLog.objects.filter(
+                    carehome=self, service_user=models.OuterRef('pk'), date=today, shift=shift,
+                )),
+            })
+
+        missed_logs = [
+            MissedLog(carehome=self, service_user_id=row['id'], date=today, shift=shift)
+            for row in residents.values('id', 'morning_logged', 'morning_flagged', 'night_logged', 'night_flagged')
+            for shift in ('morning', 'night')
+            if not row[f'{shift}_logged'] and not row[f'{shift}_flagged']
+        ]
+        return MissedLog.objects.bulk_create(missed_logs)
+
     def get_shift_times(self, shift_type):
         """Returns formatted shift time string"""
         if shift_type == 'morning':
@@ -200,6 +214,7 @@ class ABCForm(models.Model):
         ('verbal_aggression', 'Verbal aggression'),
         ('other', 'Other / stereotyped behaviours e.g., screaming'),
     ]
+    YES_NO_CHOICES = [('yes', 'Yes'), ('no', 'No')]
 
     # User relationships
     created_by = models.ForeignKey(
@@ -231,11 +246,20 @@ class ABCForm(models.Model):
         help_text="List of selected target behaviours"
     )
 
-    setting = models.TextField(blank=True)
-    antecedent = models.TextField(blank=True)
-    behaviour = models.TextField(blank=True)
-    consequences = models.TextField(blank=True)
-    reflection = models.TextField(blank=True)
+    # Setting
+    setting_location = models.CharField(max_length=255, blank=True)
+    setting_present = models.CharField(max_length=255, blank=True)
+    setting_activity = models.TextField(blank=True)
+    setting_environment = models.TextField(blank=True)
+    # Antecedent
+    antecedent_description = models.TextField(blank=True)
+    antecedent_change = models.CharField(max_length=3, choices=YES_NO_CHOICES, default='no', db_index=True)
+    antecedent_noise = models.CharField(max_length=3, choices=YES_NO_CHOICES, default='no', db_index=True)
+    antecedent_waiting = models.CharField(max_length=255, blank=True)
+    # Behaviour, consequences and reflection
+    behaviour_description = models.TextField(blank=True)
+    consequence_immediate = models.TextField(blank=True)
+    reflection_learnings = models.TextField(blank=True)
     updated_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
@@ -249,6 +273,12 @@ class ABCForm(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # target_behaviours also has a GIN index on PostgreSQL, see migration 0035
+        indexes = [
+            models.Index(fields=['date_time'], name='core_abcform_date_time_idx'),
+        ]
+
     def __str__(self):
         return f"ABC Form - {self.service_user} ({self.date_time.date()})"
 
@@ -335,10 +365,6 @@ class CustomUserManager(BaseUserManager):
         return self.create_user(email, password, **extra_fields)
 
 
-class CustomUser:
-    pass
-
-
 class CustomUser(AbstractBaseUser, PermissionsMixin):
     # Staff-related fields
     STAFF = 'staff'
@@ -405,7 +431,7 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
             return CareHome.objects.all()
         return CareHome.objects.none()
 
-    @receiver(pre_save, sender=CustomUser)
+    @receiver(pre_save, sender='core.CustomUser')
     def delete_old_image(sender, instance, **kwargs):
         if instance.pk:
             try:
@@ -418,7 +444,7 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
                 pass
 
     # Signal to delete image file when user is deleted
-    @receiver(post_delete, sender=CustomUser)
+    @receiver(post_delete, sender='core.CustomUser')
     def delete_user_image(sender, instance, **kwargs):
         if instance.image:
             if os.path.isfile(instance.image.path):
@@ -439,10 +465,12 @@ class Mapping(models.Model):
         return f"Mapping for {self.staff.get_full_name()}"
 
     def get_mapped_details(self):
+        # Works from .all() so prefetch_related('carehomes', 'service_users') avoids per-carehome queries
         details = []
+        mapped_users = list(self.service_users.all())
         for carehome in self.carehomes.all():
-            service_users = self.service_users.filter(carehome=carehome)
-            if service_users.exists():
+            service_users = [su for su in mapped_users if su.carehome_id == carehome.id]
+            if service_users:
                 su_names = ", ".join([su.first_name for su in service_users])
                 details.append(f"{carehome.name} ({su_names})")
             else:
@@ -479,6 +507,26 @@ class LogEntry(models.Model):
         verbose_name_plural = "Log Entries"
 
 
+class LatestLogEntryQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Delete the logs, then drop the coverage bits they leave unlogged with one
+        UPDATE per care home and shift. Cascades don't come through here and keep
+        Django's fast delete: coverage rows cascade with their care home or
+        resident, and ``core.signals`` clears the bits of a deleted user's logs.
+        """
+        spans = list(
+            self.order_by().values_list('carehome_id', 'shift')
+            .annotate(first=models.Min('date'), last=models.Max('date'))
+        )
+        result = super().delete()
+        ShiftCoverage.clear_unlogged(spans)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class LatestLogEntry(models.Model):
     STATUS_CHOICES = [
         ('incomplete', 'Incomplete'),
@@ -525,9 +573,16 @@ class LatestLogEntry(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = LatestLogEntryQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.date} - {self.service_user} - {self.get_shift_display()} ({self.status})"
 
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        ShiftCoverage.clear_unlogged([(self.carehome_id, self.shift, self.date, self.date)])
+        return result
+
     def save(self, *args, **kwargs):
         # Auto-set day of week if not provided
         if not self.pk:  # Only for new entries, not updates
@@ -581,31 +636,10 @@ class LatestLogEntry(models.Model):
                 'log_entries': log_entries,
             }
 
-            # Render HTML template
-            html_string = render_to_string('pdf_templates/log_pdf.html', context)
-
-            # Ensure PDF directory exists
-            pdf_dir = os.path.join(settings.MEDIA_ROOT, 'log_pdfs')
-            os.makedirs(pdf_dir, exist_ok=True)
-
-            # Generate unique filename with timestamp
-            timestamp = self.updated_at.strftime('%Y%m%d_%H%M%S')
-            pdf_filename = f"log_{self.id}_{timestamp}.pdf"
-            pdf_path = os.path.join(pdf_dir, pdf_filename)
-
-            # Generate PDF
-            HTML(string=html_string).write_pdf(pdf_path)
-
-            # Delete old PDF if exists
-            if self.log_pdf:
-                try:
-                    os.remove(self.log_pdf.path)
-                except (ValueError, OSError):
-                    pass
-
-            # Save new PDF reference
-            self.log_pdf.name = f'log_pdfs/{pdf_filename}'
-            self.save()
+            # Stored under its content hash; the previous file is left to sweep_orphan_pdfs
+            pdf = rendering.render_document('shift_log', context)
+            pdf_storage.attach_pdf(self, 'log_pdf', pdf, 'log_pdfs')
+            self.save(update_fields=['log_pdf', 'updated_at'])
 
             return True
         except Exception as e:
@@ -671,3 +705,85 @@ class MissedLog(models.Model):
     class Meta:
         verbose_name = "Missed Shift"
         verbose_name_plural = "Missed Shifts"
+        indexes = [
+            # Unresolved missed shifts in a date range (missed shifts page, digests)
+            models.Index(fields=['resolved_at', 'date'], name='core_missedlog_unresolved_idx'),
+        ]
+
+
+class ShiftCoverage(models.Model):
+    """
+    Which shifts of a day already have a log for a resident, one row per
+    (service user, date) with a bit per shift. ``record`` sets a bit with a single
+    upsert and returns the combined flags, so "both shifts done" needs no lookups.
+    """
+    MORNING = 1
+    NIGHT = 2
+    BOTH = MORNING | NIGHT
+    SHIFT_FLAGS = {'morning': MORNING, 'night': NIGHT}
+
+    service_user = models.ForeignKey(ServiceUser, on_delete=models.CASCADE, related_name='shift_coverage')
+    carehome = models.ForeignKey(CareHome, on_delete=models.CASCADE, related_name='shift_coverage')
+    date = models.DateField()
+    shifts_logged = models.PositiveSmallIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['service_user', 'date'], name='core_shiftcoverage_unique_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.service_user} - {self.shifts_logged:02b}"
+
+    @property
+    def is_complete(self):
+        return self.shifts_logged & self.BOTH == self.BOTH
+
+    def has_shift(self, shift):
+        return bool(self.shifts_logged & self.SHIFT_FLAGS[shift])
+
+    @classmethod
+    def record(cls, service_user_id, carehome_id, date, shift):
+        """Mark ``shift`` as logged and return the day's flags after the update"""
+        qn = connection.ops.quote_name
+        table = qn(cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (service_user_id, carehome_id, {qn('date')}, shifts_logged, updated_at) "
+                f"VALUES (%s, %s, %s, %s, %s) "
+                f"ON CONFLICT (service_user_id, {qn('date')}) DO UPDATE "
+                f"SET shifts_logged = {table}.shifts_logged | excluded.shifts_logged, "
+                f"updated_at = excluded.updated_at "
+                f"RETURNING shifts_logged",
+                [service_user_id, carehome_id, connection.ops.adapt_datefield_value(date),
+                 cls.SHIFT_FLAGS[shift], connection.ops.adapt_datetimefield_value(timezone.now())],
+            )
+            return cursor.fetchone()[0]
+
+    @classmethod
+    def clear_unlogged(cls, spans):
+        """
+        Drop a shift's bit on the days no log is left for it. ``spans`` holds
+        ``(carehome_id, shift, first date, last date)``; one UPDATE each.
+        """
+        for carehome_id, shift, first, last in spans:
+            logged = LatestLogEntry.objects.filter(
+                service_user_id=models.OuterRef('service_user_id'), date=models.OuterRef('date'), shift=shift
+            )
+            cls.objects.filter(carehome_id=carehome_id, date__range=(first, last)).exclude(
+                models.Exists(logged)
+            ).update(shifts_logged=models.F('shifts_logged').bitand(cls.BOTH & ~cls.SHIFT_FLAGS[shift]))
+
+
+class ScheduledJobRun(models.Model):
+    """Bookkeeping for ``run_scheduler``: when each job last ran and how it went"""
+    name = models.CharField(max_length=100, unique=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    last_finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    # Lease used as the lock on databases without advisory locks
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,73 @@
+"""
+Missed-shift email digests.
+
+Un-notified, unresolved ``MissedLog`` rows are claimed in batches with
+``SELECT ... FOR UPDATE SKIP LOCKED``, so concurrent dispatchers split the work
+instead of sending twice. Each batch becomes one digest per care home, sent to
+its team leads and managers over a single connection to the configured email
+backend, and the batch is marked notified with one UPDATE.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from .models import CareHome, CustomUser, MissedLog
+
+
+def digest_recipients():
+    """``{carehome_id: sorted emails}`` of the active team leads and managers of each care home"""
+    recipients = defaultdict(set)
+    team_leads = CustomUser.objects.filter(
+        role=CustomUser.TEAM_LEAD, is_active=True, carehome__isnull=False
+    ).values_list('carehome_id', 'email')
+    managers = CareHome.managers.through.objects.filter(
+        customuser__is_active=True
+    ).values_list('carehome_id', 'customuser__email')
+    for carehome_id, email in [*team_leads, *managers]:
+        recipients[carehome_id].add(email)
+    return {carehome_id: sorted(emails) for carehome_id, emails in recipients.items()}
+
+
+def build_digest(carehome, missed_logs, recipients):
+    context = {'carehome': carehome, 'missed_logs': missed_logs}
+    return EmailMessage(
+        subject=f"{len(missed_logs)} missed shift log{'s' if len(missed_logs) != 1 else ''} at {carehome.name}",
+        body=render_to_string('emails/missed_logs_digest.txt', context),
+        to=recipients,
+    )
+
+
+def send_missed_log_digests(batch_size=None):
+    """Send the pending digests; returns ``(digests sent, missed logs covered)``"""
+    batch_size = batch_size or getattr(settings, 'MISSED_LOG_DIGEST_BATCH_SIZE', 500)
+    recipients = digest_recipients()
+    pending = MissedLog.objects.filter(
+        is_notified=False, resolved_at__isnull=True, carehome_id__in=list(recipients)
+    )
+    sent = covered = 0
+    with get_connection() as mail:
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    pending.select_for_update(skip_locked=True, of=('self',))
+                    .select_related('carehome', 'service_user')
+                    .order_by('carehome_id', 'date', 'shift', 'id')[:batch_size]
+                )
+                if not batch:
+                    break
+                by_carehome = defaultdict(list)
+                for missed_log in batch:
+                    by_carehome[missed_log.carehome_id].append(missed_log)
+                messages = [
+                    build_digest(missed_logs[0].carehome, missed_logs, recipients[carehome_id])
+                    for carehome_id, missed_logs in by_carehome.items()
+                ]
+                # A failed send rolls the batch back so it goes out next time
+                mail.send_messages(messages)
+                MissedLog.objects.filter(id__in=[missed_log.id for missed_log in batch]).update(is_notified=True)
+            sent += len(messages)
+            covered += len(batch)
+    return sent, covered
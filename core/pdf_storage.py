@@ -0,0 +1,88 @@
+"""
+Generated PDF files.
+
+Every PDF the app renders (shift logs, ABC forms, incident reports) is stored
+here under its content hash, ``<folder>/<sha256>.pdf``: saving a document that
+is already stored writes nothing, and identical documents share one file. A new
+file is written next to its final name and moved into place with ``os.replace``,
+so readers and concurrent saves never see half a file.
+
+Writers only point their row at the new name; files no row refers to any more
+are removed by ``manage.py sweep_orphan_pdfs``, never inline, so a row saved
+at the same moment can't lose its file.
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+from django.core.files.storage import default_storage
+
+# Model, FileField and upload folder of every generated PDF
+PDF_FIELDS = [
+    ('core.LatestLogEntry', 'log_pdf', 'log_pdfs'),
+    ('core.ABCForm', 'pdf_file', 'abc_pdfs'),
+    ('core.IncidentReport', 'pdf_file', 'incident_reports'),
+]
+
+
+def save_pdf(pdf, folder):
+    """Store the ``pdf`` bytes in ``folder`` unless already there; returns the storage name"""
+    name = f'{folder}/{hashlib.sha256(pdf).hexdigest()}.pdf'
+    path = default_storage.path(name)
+    if os.path.exists(path):
+        # Marks it as in use again, so a running sweep leaves it alone
+        os.utime(path)
+        return name
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(pdf)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return name
+
+
+def attach_pdf(instance, field_name, pdf, folder):
+    """Store ``pdf`` and point ``instance.<field_name>`` at it; the caller saves the instance"""
+    getattr(instance, field_name).name = save_pdf(pdf, folder)
+
+
+def referenced_names():
+    """Storage names of the PDFs some row still refers to"""
+    from django.apps import apps
+
+    names = set()
+    for model, field_name, _ in PDF_FIELDS:
+        names.update(
+            apps.get_model(model).objects.exclude(**{f'{field_name}__isnull': True})
+            .exclude(**{field_name: ''}).values_list(field_name, flat=True)
+        )
+    return names
+
+
+def orphaned_files(min_age=3600):
+    """
+    ``(storage name, size)`` of the files in the PDF folders that no row refers to
+    and that haven't been written or reused for ``min_age`` seconds, leftover
+    temporary files included.
+    """
+    referenced = referenced_names()
+    cutoff = time.time() - min_age
+    for _, _, folder in PDF_FIELDS:
+        directory = default_storage.path(folder)
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = f'{folder}/{entry.name}'
+                if not entry.is_file() or name in referenced:
+                    continue
+                stat = entry.stat()
+                if stat.st_mtime < cutoff:
+                    yield name, stat.st_size
@@ -0,0 +1,157 @@
+"""
+UK postcode validation from a local index.
+
+``manage.py load_postcodes`` turns a postcode dataset (e.g. the ONS Postcode
+Directory) into a file of sorted, fixed-width records. The file is memory-mapped,
+so worker processes share one copy, and searched with ``bisect``: a lookup
+is a couple of dozen comparisons and needs no network. Every process notices a
+new index file on its next lookup. Postcodes missing from the index (or every
+postcode, when no index is installed) are checked against postcodes.io with a
+short timeout, and the answer is cached; when the API can't answer they are
+rejected, unless ``POSTCODE_ACCEPT_WHEN_UNAVAILABLE`` is on.
+"""
+import asyncio
+import mmap
+import os
+import re
+import tempfile
+import threading
+from bisect import bisect_left
+
+import requests
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+
+# Normalised postcodes (upper case, no space) are 5 to 7 characters
+RECORD_SIZE = 7
+POSTCODE_RE = re.compile(r'^[A-Z]{1,2}[0-9][A-Z0-9]?[0-9][A-Z]{2}$')
+API_URL = 'https://api.postcodes.io/postcodes/{}/validate'
+# Answers from the API are kept for a day; the index is the source of truth otherwise
+REMOTE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def normalise(postcode):
+    return ''.join((postcode or '').split()).upper()
+
+
+class PostcodeIndex:
+    """Sorted fixed-width postcode records, searchable with ``bisect`` as a sequence"""
+
+    def __init__(self, data):
+        self._data = data
+        self._count = len(data) // RECORD_SIZE
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, position):
+        start = position * RECORD_SIZE
+        return self._data[start:start + RECORD_SIZE]
+
+    def __contains__(self, postcode):
+        key = postcode.encode('ascii').ljust(RECORD_SIZE)
+        position = bisect_left(self, key)
+        return position < self._count and self[position] == key
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                return cls(b'')
+            return cls(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @staticmethod
+    def write(postcodes, path):
+        """Write the valid ones of ``postcodes`` to ``path``; returns how many were kept"""
+        records = sorted({
+            code.encode('ascii').ljust(RECORD_SIZE)
+            for code in map(normalise, postcodes) if POSTCODE_RE.match(code)
+        })
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Written next to the target and swapped in, so running workers never see half a file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(b''.join(records))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return len(records)
+
+
+_index = None
+# Path, inode, mtime and size of the file _index was opened from
+_index_stamp = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    The installed index, or None when ``POSTCODE_INDEX_PATH`` doesn't exist. The
+    file is reopened once ``load_postcodes`` has replaced it, in every process.
+    """
+    global _index, _index_stamp
+    path = settings.POSTCODE_INDEX_PATH
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    stamp = (path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _index_lock:
+        if _index is None or _index_stamp != stamp:
+            _index, _index_stamp = PostcodeIndex.open(path), stamp
+        return _index
+
+
+def reset_index():
+    """Forget the loaded index so the next lookup reopens the file"""
+    global _index, _index_stamp
+    with _index_lock:
+        _index = _index_stamp = None
+
+
+def in_local_index(postcode):
+    """True/False from the local index for a normalised postcode, None without an index"""
+    index = get_index()
+    if index is None:
+        return None
+    return postcode in index
+
+
+def _fetch_remote(postcode):
+    response = requests.get(API_URL.format(postcode), timeout=settings.POSTCODE_API_TIMEOUT)
+    response.raise_for_status()
+    return bool(response.json().get('result', False))
+
+
+async def avalidate(postcode):
+    """
+    Whether ``postcode`` is a real UK postcode. Badly formed ones are rejected straight
+    away and indexed ones accepted; anything else asks postcodes.io, bounded by
+    ``POSTCODE_API_TIMEOUT``. If the API can't answer, the postcode is rejected
+    unless ``POSTCODE_ACCEPT_WHEN_UNAVAILABLE`` is on.
+    """
+    postcode = normalise(postcode)
+    if not POSTCODE_RE.match(postcode):
+        return False
+    if in_local_index(postcode):
+        return True
+
+    key = f'postcode:{postcode}'
+    cached = await cache.aget(key)
+    if cached is not None:
+        return cached
+    try:
+        valid = await asyncio.wait_for(asyncio.to_thread(_fetch_remote, postcode),
+                                       timeout=settings.POSTCODE_API_TIMEOUT)
+    except (asyncio.TimeoutError, requests.RequestException, ValueError):
+        return getattr(settings, 'POSTCODE_ACCEPT_WHEN_UNAVAILABLE', False)
+    await cache.aset(key, valid, REMOTE_CACHE_TIMEOUT)
+    return valid
+
+
+def validate(postcode):
+    """``avalidate`` for sync code"""
+    return async_to_sync(avalidate)(postcode)
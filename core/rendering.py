@@ -0,0 +1,354 @@
+"""
+PDF rendering.
+
+Every document type (shift log, ABC form, incident report) is rendered by the
+engine ``PDF_ENGINES`` binds it to. The HTML engines, WeasyPrint and xhtml2pdf,
+lay out the document's template and work for every type; a direct engine draws
+one type itself, like the reportlab shift log, which is a plain table and needs
+no HTML layout. ``run_benchmarks --group pdf_engines`` compares the engines on
+the same data.
+
+HTML engines run in a small pool of spawned worker processes
+(``PDF_RENDER_WORKERS``, 0 renders in-process). Each worker has its address space
+capped at ``PDF_RENDER_MEMORY_MB``, gives up on a render after
+``PDF_RENDER_TIMEOUT`` seconds and is replaced after ``PDF_RENDER_MAX_TASKS``
+renders, so the memory a large document takes is returned with the worker and
+the web process keeps a steady footprint. ``render_stats`` keeps the render
+count, time and peak worker RSS per document type for the performance page.
+
+The PDF libraries take a long time to import and load large native libraries,
+so they are imported on first use here rather than at module level: workers,
+migrations and management commands that never render a PDF don't pay for them.
+Every render is timed as the current request's ``pdf`` section.
+"""
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.template.loader import render_to_string
+from django.utils.formats import date_format, time_format
+from django.utils.html import escape
+
+from .instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENGINE = 'weasyprint'
+# Extra seconds the web process waits for a worker past its own timeout before killing the pool
+TIMEOUT_GRACE = 5
+
+# The HTML template of each document type, for the HTML engines
+TEMPLATES = {
+    'shift_log': 'pdf_templates/log_pdf.html',
+    'abc_form': 'pdf_templates/abc_pdf.html',
+    'incident_report': 'pdf_templates/incident_pdf.html',
+}
+
+
+class RenderError(Exception):
+    pass
+
+
+class RenderTimeout(RenderError):
+    pass
+
+
+def _weasyprint(html, base_url=None):
+    from weasyprint import HTML
+
+    return HTML(string=html, base_url=base_url).write_pdf()
+
+
+def _xhtml2pdf(html, base_url=None):
+    from xhtml2pdf import pisa
+
+    result = BytesIO()
+    pdf = pisa.pisaDocument(BytesIO(html.encode('UTF-8')), result)
+    return None if pdf.err else result.getvalue()
+
+
+HTML_ENGINES = {
+    'weasyprint': _weasyprint,
+    'xhtml2pdf': _xhtml2pdf,
+}
+# What each HTML engine imports, loaded by the render workers up front
+ENGINE_MODULES = {
+    'weasyprint': 'weasyprint',
+    'xhtml2pdf': 'xhtml2pdf.pisa',
+}
+
+# ``(engine, document type)`` -> ``func(context)`` returning the PDF bytes
+DIRECT_RENDERERS = {}
+
+
+def direct_renderer(engine, document_type):
+    """Register ``func(context)`` to draw ``document_type`` without HTML under the name ``engine``"""
+    def register(func):
+        DIRECT_RENDERERS[engine, document_type] = func
+        return func
+    return register
+
+
+def engines_for(document_type):
+    """Names of the engines that can render ``document_type``"""
+    return [*HTML_ENGINES, *(engine for engine, document in DIRECT_RENDERERS if document == document_type)]
+
+
+def bound_html_engines():
+    """The HTML engines ``PDF_ENGINES`` uses"""
+    return sorted(set(getattr(settings, 'PDF_ENGINES', {}).values()) & set(HTML_ENGINES))
+
+
+def engine_for(document_type):
+    return getattr(settings, 'PDF_ENGINES', {}).get(document_type, DEFAULT_ENGINE)
+
+
+def render_document(document_type, context, target=None, base_url=None, engine=None):
+    """
+    Render ``document_type`` from ``context`` with its configured engine (or ``engine``).
+    Writes the PDF to ``target`` (a path or file) when given; always returns its bytes.
+    """
+    engine = engine or engine_for(document_type)
+    started = time.perf_counter()
+    peak_rss_kb = None
+    try:
+        if (engine, document_type) in DIRECT_RENDERERS:
+            with timed('pdf'):
+                pdf = DIRECT_RENDERERS[engine, document_type](context)
+        elif engine in HTML_ENGINES:
+            html = render_to_string(TEMPLATES[document_type], context)
+            with timed('pdf'):
+                if getattr(settings, 'PDF_RENDER_WORKERS', 0):
+                    pdf, peak_rss_kb = _render_in_pool(engine, html, base_url)
+                else:
+                    pdf = HTML_ENGINES[engine](html, base_url)
+            if pdf is None:
+                raise RenderError(f"{engine} could not render the {document_type} PDF")
+        else:
+            raise ImproperlyConfigured(
+                f"PDF engine {engine!r} can't render {document_type}; "
+                f"use one of {', '.join(engines_for(document_type))}"
+            )
+    except RenderError:
+        render_stats.record(document_type, time.perf_counter() - started, failed=True)
+        raise
+    render_stats.record(document_type, time.perf_counter() - started, peak_rss_kb)
+
+    if target is None:
+        return pdf
+    if hasattr(target, 'write'):
+        target.write(pdf)
+    else:
+        with open(target, 'wb') as fh:
+            fh.write(pdf)
+    return pdf
+
+
+# Worker side. Runs in the spawned processes, which only import this module.
+
+def _init_worker(memory_mb, engines):
+    import importlib
+    import resource
+
+    # Loaded before the cap, so it only limits the renders
+    for engine in engines:
+        try:
+            importlib.import_module(ENGINE_MODULES[engine])
+        except (ImportError, OSError):
+            # Left to fail, with this error, on the renders that need it
+            logger.exception("Could not load the %s PDF engine", engine)
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _on_alarm(signum, frame):
+    raise RenderTimeout('The PDF took longer than PDF_RENDER_TIMEOUT to render')
+
+
+def _reset_peak_rss():
+    # Linux: writing 5 to clear_refs resets VmHWM, so the next reading is this render's peak
+    try:
+        with open('/proc/self/clear_refs', 'w') as fh:
+            fh.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_kb():
+    try:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _render_in_worker(engine, html, base_url, timeout):
+    """Render ``html`` with ``engine``; returns ``(pdf bytes, peak RSS in KB)``"""
+    _reset_peak_rss()
+    signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        pdf = HTML_ENGINES[engine](html, base_url)
+    except MemoryError:
+        raise RenderError('The PDF needed more memory than PDF_RENDER_MEMORY_MB') from None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    return pdf, _peak_rss_kb()
+
+
+# Web side
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: workers start small instead of copying the web process
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PDF_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(getattr(settings, 'PDF_RENDER_MEMORY_MB', 0), bound_html_engines()),
+                max_tasks_per_child=getattr(settings, 'PDF_RENDER_MAX_TASKS', 20),
+            )
+        return _pool
+
+
+def reset_pool(pool=None):
+    """Stop the worker pool (only if it is still ``pool``); the next render starts a new one"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or (pool is not None and _pool is not pool):
+            return
+        pool, _pool = _pool, None
+    # A hung worker would block shutdown(), and the executor has no public way to kill one
+    for process in list((getattr(pool, '_processes', None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _render_in_pool(engine, html, base_url):
+    timeout = getattr(settings, 'PDF_RENDER_TIMEOUT', 60)
+    pool = get_pool()
+    try:
+        return pool.submit(_render_in_worker, engine, html, base_url, timeout).result(timeout + TIMEOUT_GRACE)
+    except FutureTimeoutError:
+        logger.error("PDF worker did not answer within %ss, restarting the pool", timeout + TIMEOUT_GRACE)
+        reset_pool(pool)
+        raise RenderTimeout('The PDF took longer than PDF_RENDER_TIMEOUT to render') from None
+    except BrokenProcessPool:
+        # Killed mid-render, e.g. by the kernel's OOM killer
+        logger.error("PDF worker died, restarting the pool")
+        reset_pool(pool)
+        raise RenderError('The PDF worker died while rendering') from None
+
+
+class RenderStats:
+    """Renders per document type in this process, with the peak RSS of the worker that did them"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+
+    def record(self, document_type, seconds, peak_rss_kb=None, failed=False):
+        with self._lock:
+            row = self._rows.setdefault(document_type, {
+                'document_type': document_type, 'renders': 0, 'failures': 0,
+                'total_ms': 0.0, 'max_ms': 0.0, 'peak_rss_kb': None,
+            })
+            row['renders'] += 1
+            row['failures'] += failed
+            row['total_ms'] += seconds * 1000
+            row['max_ms'] = max(row['max_ms'], round(seconds * 1000, 1))
+            if peak_rss_kb is not None:
+                row['peak_rss_kb'] = max(row['peak_rss_kb'] or 0, peak_rss_kb)
+
+    def summary(self):
+        with self._lock:
+            rows = [dict(row) for row in self._rows.values()]
+        for row in rows:
+            row['avg_ms'] = round(row.pop('total_ms') / row['renders'], 1)
+        return sorted(rows, key=lambda row: row['document_type'])
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+
+
+render_stats = RenderStats()
+
+
+@direct_renderer('reportlab', 'shift_log')
+def shift_log_reportlab(context):
+    """The daily recording sheet of ``log_pdf.html``, drawn as a reportlab table"""
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Table, TableStyle
+
+    latest_log = context['latest_log']
+    text = ParagraphStyle('text', fontName='Helvetica', fontSize=9, leading=12.6)
+    bold = ParagraphStyle('bold', parent=text, fontName='Helvetica-Bold')
+    heading = ParagraphStyle('heading', parent=bold, alignment=TA_CENTER)
+    centred = ParagraphStyle('centred', parent=text, alignment=TA_CENTER)
+
+    def cell(value, style=text):
+        return Paragraph(escape(value), style)
+
+    rows = [
+        [cell("Service User's Daily Recording Sheet", heading)],
+        [Paragraph(f"<b>Service User:</b> {escape(latest_log.service_user)}", text)],
+        [cell(label, heading) for label in ('Date', 'Day', 'Staff Initial', 'Shift')],
+        [cell(date_format(latest_log.date, 'SHORT_DATE_FORMAT')), cell(latest_log.day_of_week),
+         cell(latest_log.staff_initials), cell(latest_log.get_shift_display())],
+        [cell('Daily Log Entries', heading)],
+        [cell('Time', heading), cell('Details', heading)],
+    ]
+    entries = [
+        [cell(time_format(entry.time_slot, 'H:i'), bold),
+         Paragraph(escape(entry.content or '').replace('\r\n', '\n').replace('\n', '<br/>'), text)]
+        for entry in context['log_entries']
+    ]
+    rows += entries or [[cell('No log entries found for this shift.', centred)]]
+    # Blank cells under the column spans
+    rows = [row + [''] * (4 - len(row)) for row in rows]
+    spans = [('SPAN', (0, row), (3, row)) for row in (0, 1, 4)]
+    spans += [('SPAN', (1 if entries else 0, row), (3, row)) for row in range(6, len(rows))]
+    spans.append(('SPAN', (1, 5), (3, 5)))
+
+    grey = colors.HexColor('#f2f2f2')
+    style = TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.75, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        *[('BACKGROUND', (0, row), (-1, row), grey) for row in (0, 2, 4, 5)],
+        *[(padding, (0, 0), (-1, -1), 3.75)
+          for padding in ('LEFTPADDING', 'RIGHTPADDING', 'TOPPADDING', 'BOTTOMPADDING')],
+        *spans,
+    ])
+
+    # Same page as the template: A4, half-inch page margins plus the half-inch table indent.
+    # Invariant leaves out the creation time and random ID, so the same log gives the same file.
+    output = BytesIO()
+    document = SimpleDocTemplate(output, pagesize=A4, title='Log PDF', leftMargin=inch, rightMargin=inch,
+                                 topMargin=0.5 * inch, bottomMargin=0.5 * inch, invariant=True)
+    # The time column is wide enough for the date above it, which the template lets wrap
+    width = document.width
+    document.build([Table(rows, colWidths=[width * 0.16] + [width * 0.28] * 3, style=style)])
+    return output.getvalue()
@@ -0,0 +1,250 @@
+"""
+In-process scheduler for periodic jobs.
+
+``manage.py run_scheduler`` calls ``run_due_jobs()`` in a loop. Each job says
+how often it runs; when it is due it runs under a lock named after the job
+(a PostgreSQL advisory lock, or a lease on its ``ScheduledJobRun`` row on other
+databases), so several scheduler processes never run the same job twice.
+``ScheduledJobRun`` keeps when each job last ran, which also tells a job what
+window it has to cover after a restart.
+"""
+import csv
+import gzip
+import logging
+import os
+import traceback
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import ABCForm, CareHome, LatestLogEntry, LogEntry, MissedLog, ScheduledJobRun, ShiftCoverage
+from .notifications import send_missed_log_digests
+
+logger = logging.getLogger(__name__)
+
+# How long a lease lock holds if its scheduler dies mid-job
+LEASE_DURATION = timedelta(minutes=30)
+# A row whose PDF could not be rendered is left out of the backfill this long, so it can't fill every batch
+BACKFILL_RETRY_AFTER = timedelta(days=1)
+# Rows written to the archive file and deleted per statement
+ARCHIVE_BATCH_SIZE = 1000
+
+
+class Job:
+    def __init__(self, name, func, every):
+        self.name = name
+        self.func = func
+        self.every = every
+
+    def is_due(self, last_run_at, now):
+        return last_run_at is None or now - last_run_at >= self.every
+
+
+JOBS = {}
+
+
+def job(name, every):
+    """Register ``func(since, now)`` to run every ``every`` (a timedelta)"""
+    def register(func):
+        JOBS[name] = Job(name, func, every)
+        return func
+    return register
+
+
+def _lock_key(name):
+    # pg advisory locks take a bigint; crc32 is stable across processes, unlike hash()
+    return zlib.crc32(f'core.scheduler:{name}'.encode())
+
+
+@contextmanager
+def advisory_lock(name):
+    """Yield whether this process got the lock of ``name``; never waits for it"""
+    if connection.vendor == 'postgresql':
+        key = _lock_key(name)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [key])
+            acquired = cursor.fetchone()[0]
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_unlock(%s)', [key])
+        return
+
+    now = timezone.now()
+    ScheduledJobRun.objects.get_or_create(name=name)
+    acquired = ScheduledJobRun.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now), name=name
+    ).update(locked_until=now + LEASE_DURATION) == 1
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            ScheduledJobRun.objects.filter(name=name).update(locked_until=None)
+
+
+def run_job(job, now=None, force=False):
+    """Run ``job`` if it is due and no other process holds it; returns whether it ran"""
+    now = now or timezone.now()
+    with advisory_lock(job.name) as acquired:
+        if not acquired:
+            return False
+        # Read inside the lock, another scheduler may have just finished it
+        run, _ = ScheduledJobRun.objects.get_or_create(name=job.name)
+        if not force and not job.is_due(run.last_run_at, now):
+            return False
+
+        since = run.last_run_at
+        run.last_run_at = now
+        run.save(update_fields=['last_run_at'])
+        error = ''
+        try:
+            job.func(since, now)
+        except Exception:
+            logger.exception("Scheduled job %s failed", job.name)
+            error = traceback.format_exc()
+        ScheduledJobRun.objects.filter(pk=run.pk).update(last_finished_at=timezone.now(), last_error=error)
+        return True
+
+
+def run_due_jobs(names=None, now=None, force=False):
+    """Run every due job (or only ``names``); returns the names that ran"""
+    return [
+        name for name, scheduled in JOBS.items()
+        if (names is None or name in names) and run_job(scheduled, now, force)
+    ]
+
+
+def shift_ends_between(carehome, since, now):
+    """
+    ``(date, shift)`` for each shift of ``carehome`` that ended in ``(since, now]``.
+    A night shift ending at or before its start time counts towards the day it started.
+    """
+    grace = timedelta(minutes=getattr(settings, 'MISSED_LOG_GRACE_MINUTES', 30))
+    since, now = timezone.localtime(since - grace), timezone.localtime(now - grace)
+    ends = []
+    for shift in ('morning', 'night'):
+        start, end = getattr(carehome, f'{shift}_shift_start'), getattr(carehome, f'{shift}_shift_end')
+        if end is None:
+            continue
+        overnight = start is not None and end <= start
+        day = since.date()
+        while day <= now.date():
+            ended_at = timezone.make_aware(datetime.combine(day, end))
+            if since < ended_at <= now:
+                ends.append((day - timedelta(days=1) if overnight else day, shift))
+            day += timedelta(days=1)
+    return ends
+
+
+@job('missed-logs', every=timedelta(minutes=1))
+def check_ended_shifts(since, now):
+    """Record missed logs for every shift that ended since the last run"""
+    # After a long outage only look back two days; older gaps are left to check_missed_logs
+    since = max(since or now - timedelta(minutes=1), now - timedelta(days=2))
+    carehomes = CareHome.objects.filter(Q(morning_shift_end__isnull=False) | Q(night_shift_end__isnull=False))
+    for carehome in carehomes:
+        for day, shift in shift_ends_between(carehome, since, now):
+            carehome.check_missed_logs(day, shifts=(shift,))
+
+
+@job('missed-log-digests', every=timedelta(minutes=15))
+def notify_missed_logs(since, now):
+    send_missed_log_digests()
+
+
+def backfill_failures(kind, now=None):
+    """``{pk: failed at}`` of the ``kind`` rows whose backfill failed within ``BACKFILL_RETRY_AFTER``"""
+    now = now or timezone.now()
+    failed = cache.get(f'pdf-backfill:failed:{kind}', {})
+    return {pk: at for pk, at in failed.items() if now - at < BACKFILL_RETRY_AFTER}
+
+
+def backfill(kind, queryset, render, limit, now=None):
+    """Run ``render(row)`` on up to ``limit`` rows, oldest first, skipping recent failures"""
+    now = now or timezone.now()
+    failed = backfill_failures(kind, now)
+    for row in queryset.exclude(pk__in=list(failed)).order_by('pk')[:limit]:
+        try:
+            rendered = render(row) is not False
+        except Exception:
+            logger.exception("Could not render the PDF of %s %s", kind, row.pk)
+            rendered = False
+        if not rendered:
+            failed[row.pk] = now
+    cache.set(f'pdf-backfill:failed:{kind}', failed, BACKFILL_RETRY_AFTER.total_seconds())
+
+
+@job('pdf-backfill', every=timedelta(minutes=10))
+def backfill_pdfs(since, now):
+    """Render the PDFs of locked shift logs and ABC forms that don't have one yet"""
+    from .views import generate_abc_pdf
+
+    limit = getattr(settings, 'PDF_BACKFILL_BATCH_SIZE', 50)
+    # A log without entries has nothing to render
+    logs = (LatestLogEntry.objects.filter(status='locked')
+            .filter(Q(log_pdf__isnull=True) | Q(log_pdf=''))
+            .filter(Exists(LogEntry.objects.filter(latest_log=OuterRef('pk'))))
+            .select_related('carehome', 'service_user', 'user'))
+    backfill('shift_log', logs, LatestLogEntry.generate_pdf, limit, now)
+    abc_forms = (ABCForm.objects.filter(Q(pdf_file__isnull=True) | Q(pdf_file=''))
+                 .select_related('service_user', 'created_by'))
+    backfill('abc_form', abc_forms, generate_abc_pdf, limit, now)
+
+
+@job('clear-sessions', every=timedelta(days=1))
+def clear_sessions(since, now):
+    call_command('clearsessions')
+
+
+@job('sweep-pdfs', every=timedelta(days=1))
+def sweep_pdfs(since, now):
+    call_command('sweep_orphan_pdfs')
+
+
+def archive_rows(queryset, name, now):
+    """
+    Move the rows of ``queryset`` into ``<ARCHIVE_DIR>/<name>-<timestamp>.csv.gz``:
+    each batch is written to the file before it is deleted. Returns the row count.
+    """
+    model = queryset.model
+    fields = [field.attname for field in model._meta.concrete_fields]
+    pk_index = fields.index(model._meta.pk.attname)
+    directory = settings.ARCHIVE_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{name}-{timezone.localtime(now):%Y%m%d%H%M%S}.csv.gz')
+
+    archived = 0
+    with gzip.open(path, 'wt', newline='') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(fields)
+        while batch := list(queryset.order_by('pk').values_list(*fields)[:ARCHIVE_BATCH_SIZE]):
+            writer.writerows(batch)
+            fh.flush()
+            model.objects.filter(pk__in=[row[pk_index] for row in batch]).delete()
+            archived += len(batch)
+    if not archived:
+        os.remove(path)
+    return archived
+
+
+@job('archive', every=timedelta(days=1))
+def archive_old_rows(since, now):
+    """
+    Move resolved missed logs and shift coverage older than ``ARCHIVE_AFTER_DAYS``
+    out of the database into ``ARCHIVE_DIR``. Off while ``ARCHIVE_AFTER_DAYS`` is 0.
+    """
+    days = getattr(settings, 'ARCHIVE_AFTER_DAYS', 0)
+    if not days:
+        return
+    cutoff = now - timedelta(days=days)
+    archive_rows(MissedLog.objects.filter(resolved_at__lt=cutoff), 'missed_logs', now)
+    archive_rows(ShiftCoverage.objects.filter(date__lt=cutoff.date()), 'shift_coverage', now)
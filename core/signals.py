@@ -1,67 +1,123 @@
-from datetime import timedelta
-
-from django.db.models.signals import post_save
+from django.db.models import Max, Min
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.utils import timezone
-from .models import LatestLogEntry, MissedLog, CareHome
+from . import access, lookups
+from .context_processors import invalidate_navigation
+from .jobs import run_in_background
+from .models import LatestLogEntry, MissedLog, CareHome, ServiceUser, CustomUser, Mapping, ShiftCoverage
+
+# Fields shown by the lookup API; saves touching none of them (e.g. last_login) keep the cache
+LOOKUP_FIELDS = {'first_name', 'last_name', 'dob', 'carehome', 'carehome_id'}
 
 
 @receiver(post_save, sender=LatestLogEntry)
 def update_missed_logs(sender, instance, created, **kwargs):
     """
-    When a new log is created, check if it resolves any missed logs
+    When a new log is created, record its shift in the day's coverage and resolve the
+    missed logs it covers: that shift, or the whole day once both shifts are in
     """
     if created:
-        # Check if there was a missed log for this service user, date, and shift
-        MissedLog.objects.filter(
-            carehome=instance.carehome,
-            service_user=instance.service_user,
+        flags = ShiftCoverage.record(instance.service_user_id, instance.carehome_id, instance.date, instance.shift)
+        missed = MissedLog.objects.filter(
+            carehome_id=instance.carehome_id,
+            service_user_id=instance.service_user_id,
             date=instance.date,
-            shift=instance.shift,
             resolved_at__isnull=True
-        ).update(resolved_at=timezone.now())
+        )
+        if flags & ShiftCoverage.BOTH != ShiftCoverage.BOTH:
+            missed = missed.filter(shift=instance.shift)
+        missed.update(resolved_at=timezone.now())
 
-        # Check if both shifts are now complete
-        morning_exists = LatestLogEntry.objects.filter(
-            carehome=instance.carehome,
-            service_user=instance.service_user,
-            date=instance.date,
-            shift='morning'
-        ).exists()
 
-        afternoon_exists = LatestLogEntry.objects.filter(
-            carehome=instance.carehome,
-            service_user=instance.service_user,
-            date=instance.date,
-            shift='night'
-        ).exists()
+@receiver(pre_delete, sender=CustomUser)
+def remember_coverage_spans(sender, instance, **kwargs):
+    """The user's logs go with them in the cascade; keep which days they covered"""
+    instance._coverage_spans = list(
+        instance.latest_log_entries.order_by().values_list('carehome_id', 'shift')
+        .annotate(first=Min('date'), last=Max('date'))
+    )
+
 
-        if morning_exists and afternoon_exists:
-            # Both shifts are logged, resolve any remaining missed logs
-            instance.carehome.resolve_missed_logs(
-                service_user=instance.service_user,
-                date=instance.date
-            )
+@receiver(post_delete, sender=CustomUser)
+def clear_coverage_of_deleted_user(sender, instance, **kwargs):
+    """Drop the bits of the days no other log covers, so they can be flagged as missed"""
+    ShiftCoverage.clear_unlogged(getattr(instance, '_coverage_spans', ()))
 
 
 @receiver(post_save, sender=CareHome)
 def check_existing_missed_logs(sender, instance, created, **kwargs):
-    """Check for missed logs when carehome is updated"""
-    if not created:
-        # Check for service users without logs in the last 6 months
-        six_months_ago = timezone.now() - timedelta(days=180)
-        for service_user in instance.service_users.all():
-            for shift in ['morning', 'night']:
-                has_log = service_user.latest_log_entries.filter(
-                    date__gte=six_months_ago,
-                    shift=shift,
-                    status__in=['complete', 'locked']
-                ).exists()
-
-                if not has_log:
-                    MissedLog.objects.get_or_create(
-                        carehome=instance,
-                        service_user=service_user,
-                        date=timezone.now().date(),
-                        shift=shift
-                    )
+    """Re-check residents for missed logs once the care home's shift times change"""
+    if not created and getattr(instance, '_shift_times_changed', False):
+        run_in_background(flag_unlogged_shifts, instance.pk)
+
+
+def flag_unlogged_shifts(carehome_id):
+    carehome = CareHome.objects.filter(pk=carehome_id).first()
+    if carehome is not None:
+        carehome.flag_unlogged_shifts()
+
+
+@receiver(pre_save, sender=ServiceUser)
+@receiver(pre_save, sender=CustomUser)
+def remember_previous_carehome(sender, instance, update_fields=None, **kwargs):
+    """Keep the care home the row is moving away from so its lookup entry is dropped too"""
+    instance._previous_carehome_id = None
+    if update_fields is not None and not LOOKUP_FIELDS.intersection(update_fields):
+        return
+    if instance.pk:
+        instance._previous_carehome_id = (
+            sender.objects.filter(pk=instance.pk).values_list('carehome_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=ServiceUser)
+@receiver(post_save, sender=CustomUser)
+def invalidate_lookup_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not LOOKUP_FIELDS.intersection(update_fields):
+        return
+    lookups.invalidate(sender, instance.carehome_id, getattr(instance, '_previous_carehome_id', None))
+
+
+@receiver(post_delete, sender=ServiceUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_lookup_on_delete(sender, instance, **kwargs):
+    lookups.invalidate(sender, instance.carehome_id)
+
+
+# Saves of these fields alone (logins, activity) never change what a user can access
+ACCESS_IGNORED_FIELDS = {'last_login', 'last_active', 'password'}
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=ServiceUser)
+@receiver(post_save, sender=CareHome)
+@receiver(post_save, sender=Mapping)
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_delete, sender=ServiceUser)
+@receiver(post_delete, sender=CareHome)
+@receiver(post_delete, sender=Mapping)
+def invalidate_access_scopes(sender, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= ACCESS_IGNORED_FIELDS:
+        return
+    access.invalidate_all()
+
+
+@receiver(m2m_changed, sender=Mapping.carehomes.through)
+@receiver(m2m_changed, sender=Mapping.service_users.through)
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+def invalidate_access_scopes_on_m2m(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        access.invalidate_all()
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=ServiceUser)
+@receiver(post_save, sender=CareHome)
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_delete, sender=ServiceUser)
+@receiver(post_delete, sender=CareHome)
+def invalidate_navigation_fragments(sender, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= ACCESS_IGNORED_FIELDS:
+        return
+    invalidate_navigation()
@@ -0,0 +1,14 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+register = template.Library()
+
+
+@register.simple_tag
+def bundle(name):
+    """Tags for a STATIC_BUNDLES entry: the built bundle, or each of its sources when bundling is off"""
+    files = [f'bundles/{name}'] if settings.STATIC_BUNDLES_ENABLED else settings.STATIC_BUNDLES[name]
+    tag = '<link href="{}" rel="stylesheet">' if name.endswith('.css') else '<script src="{}"></script>'
+    return format_html_join('\n', tag, ((static(path),) for path in files))
@@ -6,4 +6,5 @@ register = template.Library()
 @register.filter
 def filter_service_user(logs, service_user):
     """Filter logs by service user"""
-    return [log for log in logs if log.service_user == service_user]
\ No newline at end of file
+    # Compare ids so each log doesn't fetch its service user
+    return [log for log in logs if log.service_user_id == service_user.pk]
\ No newline at end of file
@@ -36,6 +36,7 @@ urlpatterns = ([
                    path('staff/toggle-status/<int:pk>/', views.toggle_staff_status, name='toggle-staff-status'),
                    path('abc/new/', views.fill_abc_form, name='fill_abc_form'),
                    path('abc/', views.abc_form_list, name='abc_form_list'),
+                   path('abc/api/', views.abc_form_api, name='abc_form_api'),
                    path('abc/<int:form_id>/edit/', views.edit_abc_form, name='edit_abc_form'),
                    path('abc/<int:form_id>/', views.view_abc_form, name='view_abc_form'),
                    path('abc/<int:form_id>/pdf/', views.download_abc_pdf, name='download_abc_pdf'),
@@ -62,5 +63,7 @@ urlpatterns = ([
                    re_path(r'^\.(git|svn|env)/', lambda r: HttpResponseForbidden()),
                    re_path(r'@fs/', lambda r: HttpResponseForbidden()),
                    path('ajax/service-users/', views.get_service_users, name='ajax-service-users'),
+                   path('ajax/lookup/', views.lookup_view, name='ajax-lookup'),
+                   path('ajax/service-user-dob/', views.service_user_dob_view, name='ajax-service-user-dob'),
                ]
                + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT))
@@ -2,14 +2,11 @@ from datetime import time, datetime, timedelta
 
 from django.core.files.storage import default_storage
 from django.utils.timezone import now
-from django.core.files import File
 from .models import LatestLogEntry
-import os
-from django.template.loader import render_to_string
-from django.conf import settings
-from weasyprint import HTML
 from django.utils import timezone
+from .access import get_scope
 from .models import CustomUser, LatestLogEntry, LogEntry, IncidentReport, ABCForm, ServiceUser
+from . import pdf_storage, rendering
 
 def get_filtered_queryset(model, user, *, filter_today=False):
     """
@@ -17,19 +14,20 @@ def get_filtered_queryset(model, user, *, filter_today=False):
     Example: model = LatestLogEntry or IncidentReport
     """
     qs = model.objects.all()
+    scope = get_scope(user)
 
-    if user.is_superuser or user.role == CustomUser.Manager:
+    if scope.is_manager:
         return qs
 
-    if user.role == CustomUser.TEAM_LEAD:
+    if scope.is_team_lead:
         if hasattr(model, 'carehome'):
-            qs = qs.filter(carehome=user.carehome)
+            qs = qs.filter(carehome_id__in=scope.carehome_ids)
         elif hasattr(model, 'service_user'):
-            qs = qs.filter(service_user__carehome=user.carehome)
+            qs = qs.filter(service_user__carehome_id__in=scope.carehome_ids)
         elif model == CustomUser:
-            qs = qs.filter(carehome=user.carehome, role=CustomUser.STAFF)
+            qs = qs.filter(carehome_id__in=scope.carehome_ids, role=CustomUser.STAFF)
 
-    elif user.role == CustomUser.STAFF:
+    elif scope.role == CustomUser.STAFF:
         if hasattr(model, 'staff'):
             qs = qs.filter(staff=user)
         elif hasattr(model, 'user'):
@@ -57,10 +55,11 @@ def get_or_create_latest_log(user, carehome, service_user, shift):
 
 def complete_log(latest_log):
     latest_log.status = 'locked'
-    pdf_path = generate_pdf(latest_log)  # ← You define this function
-    latest_log.log_pdf.save('log.pdf', File(open(pdf_path, 'rb')))
+    latest_log.log_pdf.name = generate_pdf(latest_log)
     latest_log.save()
+
 def generate_pdf(latest_log):
+    """Render the shift log's PDF into storage; returns its storage name"""
     from .models import LogEntry  # Import here to avoid circular import
 
     log_entries = LogEntry.objects.filter(
@@ -71,19 +70,11 @@ def generate_pdf(latest_log):
         date=latest_log.date
     )
 
-    html = render_to_string('pdf/log_template.html', {
+    pdf = rendering.render_document('shift_log', {
+        'latest_log': latest_log,
         'log_entries': log_entries,
-        'log_info': latest_log,
     })
-
-    filename = f"log_{latest_log.id}.pdf"
-    output_path = os.path.join(settings.MEDIA_ROOT, 'log_pdfs', filename)
-
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-    HTML(string=html).write_pdf(output_path)
-
-    return output_path  # So you can open and attach the file later
+    return pdf_storage.save_pdf(pdf, 'log_pdfs')
 
 def generate_shift_times(base_time: time, total_slots: int = 12) -> list[time]:
     times = []
@@ -1,40 +1,38 @@
 import json
 import logging
 import os
-import tempfile
 from email.quoprimime import unquote
 from http.cookiejar import logger
 
-import imgkit
-from PIL import Image
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.core.files.base import ContentFile
-from django.db import transaction
-from django.db.models import Q
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Q
 from django.forms import model_to_dict
 from django.http import HttpResponseForbidden, FileResponse, Http404
 from django.utils.timezone import now
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from django.views.decorators.csrf import csrf_exempt
-import requests
 from django.views.decorators.http import require_POST, require_GET
-from weasyprint import HTML
-from weasyprint.text.fonts import FontConfiguration
 
 from carehome_project import settings
 from core.utils import get_or_create_latest_log, get_filtered_queryset, generate_shift_times, delete_image_file
+from . import lookups, pdf_storage, postcodes, rendering
+from .access import aget_scope
+from .jobs import run_coalesced_in_background
+from .instrumentation import request_stats, slow_queries
 from .models import CustomUser, LatestLogEntry, Mapping, MissedLog
 from .forms import ServiceUserForm, StaffCreationForm, CareHomeForm, MappingForm, StaffEditForm
-from io import BytesIO
-from django.template.loader import render_to_string
 from django.http import HttpResponse
-from xhtml2pdf import pisa
 from .models import ABCForm, IncidentReport
 from .forms import ABCFormForm, IncidentReportForm
 from django.contrib import messages
 from datetime import datetime, timedelta, date
 from django.utils import timezone
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from .models import CareHome, ServiceUser, LogEntry
 from .forms import LogEntryForm
 from django.http import JsonResponse
@@ -155,76 +153,158 @@ def create_log_view(request):
         'selected_carehome_id': selected_carehome_id,
     })
 
-def render_pdf_view(template_src, context_dict):
-    html = render_to_string(template_src, context_dict)
-    result = BytesIO()
-    pdf = pisa.pisaDocument(BytesIO(html.encode("UTF-8")), result)
-    if not pdf.err:
-        return HttpResponse(result.getvalue(), content_type='application/pdf')
-    return HttpResponse('Error generating PDF', status=500)
-
 
 logger = logging.getLogger(__name__)
 
 
-@login_required
-def abc_form_list(request):
-    """Show list of forms with visibility control"""
-    if request.user.is_superuser:
-        forms = ABCForm.objects.all().order_by('-date_time')
-    elif request.user.groups.filter(name='Supervisors').exists():
+def abc_form_access(scope, user, form):
+    """
+    ``(can_view, can_edit)`` for one ABC form, worked out from the request's access
+    scope without touching the database so it can be applied to every row of a list
+    """
+    is_creator = form.created_by_id == user.id
+    can_view = (scope.is_superuser or is_creator or
+                (scope.is_supervisor and scope.has_service_user(form.service_user_id)))
+    can_edit = scope.is_superuser or scope.is_supervisor or is_creator
+    return can_view, can_edit
+
+
+ABC_PAGE_SIZE = 25
+
+
+def filter_by_behaviours(queryset, behaviours, match_all=False):
+    """
+    ABC forms tagged with any (or all) of ``behaviours``. On PostgreSQL this is jsonb
+    containment, served by the GIN index from migration 0035; other backends fall
+    back to matching the quoted value in the stored JSON text.
+    """
+    if not behaviours:
+        return queryset
+    if connection.vendor == 'postgresql':
+        if match_all:
+            return queryset.filter(target_behaviours__contains=list(behaviours))
+        conditions = [Q(target_behaviours__contains=[behaviour]) for behaviour in behaviours]
+    else:
+        conditions = [Q(target_behaviours__icontains=json.dumps(behaviour)) for behaviour in behaviours]
+
+    condition = conditions[0]
+    for other in conditions[1:]:
+        condition = condition & other if match_all else condition | other
+    return queryset.filter(condition)
+
+
+def parse_date_param(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        return None
+
+
+def get_abc_forms(request):
+    """
+    ABC forms the user may see, narrowed by the query string:
+    ``behaviour`` (repeatable), ``match=all``, ``date_from`` and ``date_to`` (YYYY-MM-DD)
+    """
+    scope = request.access
+    if scope.is_superuser or (scope.is_supervisor and scope.service_user_ids is None):
+        forms = ABCForm.objects.all()
+    elif scope.is_supervisor:
         forms = ABCForm.objects.filter(
-            Q(service_user__in=request.user.managed_clients.all()) |
+            Q(service_user_id__in=scope.service_user_ids) |
             Q(created_by=request.user)
-        ).order_by('-date_time')
+        )
     else:  # Regular care staff
-        forms = ABCForm.objects.filter(
-            created_by=request.user
-        ).order_by('-date_time')
+        forms = ABCForm.objects.filter(created_by=request.user)
 
-    # Add select_related for performance
-    forms = forms.select_related('service_user', 'created_by')
+    valid = dict(ABCForm.TARGET_BEHAVIOUR_CHOICES)
+    behaviours = [b for b in request.GET.getlist('behaviour') if b in valid]
+    forms = filter_by_behaviours(forms, behaviours, match_all=request.GET.get('match') == 'all')
 
+    # Whole-day bounds as datetimes so the date_time index can be used
+    date_from = parse_date_param(request.GET.get('date_from'))
+    date_to = parse_date_param(request.GET.get('date_to'))
+    if date_from:
+        forms = forms.filter(date_time__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+    if date_to:
+        forms = forms.filter(date_time__lt=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min)))
+
+    return forms.order_by('-date_time', '-id')
+
+
+@login_required
+def abc_form_list(request):
+    """Show list of forms with visibility control"""
+    scope = request.access
+    forms = get_abc_forms(request).select_related('service_user', 'created_by')
+    page = Paginator(forms, ABC_PAGE_SIZE).get_page(request.GET.get('page'))
+
+    # The PDF button follows the role, but links the user would be refused are hidden
+    by_role = scope.is_superuser or scope.role in (CustomUser.Manager, CustomUser.TEAM_LEAD)
+    for form in page:
+        can_view, can_edit = abc_form_access(scope, request.user, form)
+        form.can_download = by_role and can_view
+        form.can_edit = can_edit
+
+    query = request.GET.copy()
+    query.pop('page', None)
     return render(request, 'forms/abc_form_list.html', {
-        'forms': forms,
-        'can_edit': lambda form: (
-                request.user.is_superuser or
-                request.user.groups.filter(name='Supervisors').exists()
-        )
+        'forms': page.object_list,
+        'page_obj': page,
+        'query_string': query.urlencode(),
+        'behaviour_choices': ABCForm.TARGET_BEHAVIOUR_CHOICES,
+        'selected_behaviours': request.GET.getlist('behaviour'),
+        'search_params': request.GET,
+    })
+
+
+@login_required
+@require_GET
+def abc_form_api(request):
+    """
+    JSON list of ABC forms with the same filters as the list page, plus
+    ``page`` and ``page_size`` (at most 100)
+    """
+    try:
+        page_size = min(max(int(request.GET.get('page_size', ABC_PAGE_SIZE)), 1), 100)
+    except ValueError:
+        page_size = ABC_PAGE_SIZE
+    forms = get_abc_forms(request).values(
+        'id', 'date_time', 'staff', 'target_behaviours', 'antecedent_change', 'antecedent_noise',
+        'service_user_id', 'service_user__first_name', 'service_user__last_name',
+    )
+    page = Paginator(forms, page_size).get_page(request.GET.get('page'))
+
+    return JsonResponse({
+        'count': page.paginator.count,
+        'page': page.number,
+        'num_pages': page.paginator.num_pages,
+        'results': [{
+            'id': row['id'],
+            'date_time': row['date_time'].isoformat(),
+            'service_user': {
+                'id': row['service_user_id'],
+                'name': f"{row['service_user__first_name']} {row['service_user__last_name']}",
+            },
+            'staff': row['staff'],
+            'target_behaviours': row['target_behaviours'],
+            'antecedent_change': row['antecedent_change'],
+            'antecedent_noise': row['antecedent_noise'],
+        } for row in page.object_list],
     })
 
 
 @login_required
 def view_abc_form(request, form_id):  # Changed from pk to form_id
-    form_instance = get_object_or_404(ABCForm, pk=form_id)
+    form_instance = get_object_or_404(ABCForm.objects.select_related('service_user'), pk=form_id)
 
     # Check permissions
-    if not (request.user.is_superuser or
-            request.user == form_instance.created_by or
-            (request.user.groups.filter(name='Supervisors').exists() and
-             form_instance.service_user in request.user.managed_clients.all())):
+    can_view, can_edit = abc_form_access(request.access, request.user, form_instance)
+    if not can_view:
         return HttpResponseForbidden("You don't have permission to view this form")
 
     context = {
-        'data': {
-            'id': form_instance.id,
-            'service_user': form_instance.service_user,
-            'date_of_birth': form_instance.date_of_birth,
-            'staff': form_instance.staff,
-            'date_time': form_instance.date_time,
-            'target_behaviours': form_instance.target_behaviours,
-            'setting': form_instance.setting,
-            'antecedent': form_instance.antecedent,
-            'behaviour': form_instance.behaviour,
-            'consequences': form_instance.consequences,
-            'reflection': form_instance.reflection,
-            'pdf_file': form_instance.pdf_file
-        },
-        'can_edit': (
-                request.user.is_superuser or
-                request.user.groups.filter(name='Supervisors').exists() or
-                request.user == form_instance.created_by
-        )
+        'data': form_instance,
+        'can_edit': can_edit
     }
     return render(request, 'core/abc_form_detail_template.html', context)
 
@@ -235,10 +315,8 @@ def download_abc_pdf(request, form_id):
     instance = get_object_or_404(ABCForm, id=form_id)
 
     # Permission check
-    if not (request.user.is_superuser or
-            request.user == instance.created_by or
-            request.user.groups.filter(name='Supervisors').exists() and
-            instance.service_user in request.user.managed_clients.all()):
+    can_view, _ = abc_form_access(request.access, request.user, instance)
+    if not can_view:
         return HttpResponse("Not authorized", status=403)
 
     if not instance.pdf_file:
@@ -249,45 +327,26 @@ def download_abc_pdf(request, form_id):
     return response
 
 
+def generate_abc_pdf(instance):
+    """Render the ABC form PDF and attach it to the instance; the previous file is left to sweep_orphan_pdfs"""
+    pdf_bytes = rendering.render_document('abc_form', {'data': instance})
+    pdf_storage.attach_pdf(instance, 'pdf_file', pdf_bytes, 'abc_pdfs')
+    instance.save(update_fields=['pdf_file'])
+
+
 @login_required
 def fill_abc_form(request):
     if request.method == 'POST':
         form = ABCFormForm(request.POST)
         if form.is_valid():
             try:
-                # Save the form - the combining of fields is now handled in form.save()
                 instance = form.save(commit=False)
                 instance.created_by = request.user
                 instance.save()
                 form.save_m2m()  # Save many-to-many relationships (target_behaviours)
 
                 # PDF Generation
-                context = {
-                    'data': {
-                        'target_behaviours': form.cleaned_data['target_behaviours'],
-                        'service_user': instance.service_user,
-                        'date_of_birth': instance.date_of_birth,
-                        'staff': instance.staff,
-                        'date_time': instance.date_time,
-                        'setting': instance.setting,
-                        'antecedent': instance.antecedent,
-                        'behaviour': instance.behaviour,
-                        'consequences': instance.consequences,
-                        'reflection': instance.reflection
-                    }
-                }
-
-                html_string = render_to_string('pdf_templates/abc_pdf.html', context)
-                pdf_bytes = HTML(string=html_string).write_pdf()
-
-                # Delete old PDF if exists (for edit case)
-                if hasattr(instance, 'pdf_file') and instance.pdf_file:
-                    instance.pdf_file.delete()
-
-                # Save new PDF
-                file_content = ContentFile(pdf_bytes)
-                filename = f'abc_form_{instance.id}_{instance.date_time.date()}.pdf'
-                instance.pdf_file.save(filename, file_content, save=True)
+                generate_abc_pdf(instance)
 
                 messages.success(request, 'ABC Form saved successfully!')
                 return redirect('abc_form_list')
@@ -323,30 +382,7 @@ def edit_abc_form(request, form_id):
                 form.save_m2m()
 
                 # Regenerate PDF (same as fill_abc_form)
-                context = {
-                    'data': {
-                        'target_behaviours': form.cleaned_data['target_behaviours'],
-                        'service_user': updated.service_user,
-                        'date_of_birth': updated.date_of_birth,
-                        'staff': updated.staff,
-                        'date_time': updated.date_time,
-                        'setting': updated.setting,
-                        'antecedent': updated.antecedent,
-                        'behaviour': updated.behaviour,
-                        'consequences': updated.consequences,
-                        'reflection': updated.reflection
-                    }
-                }
-
-                html_string = render_to_string('pdf_templates/abc_pdf.html', context)
-                pdf_bytes = HTML(string=html_string).write_pdf()
-
-                if updated.pdf_file:
-                    updated.pdf_file.delete()
-
-                file_content = ContentFile(pdf_bytes)
-                filename = f'abc_form_{updated.id}_{updated.date_time.date()}.pdf'
-                updated.pdf_file.save(filename, file_content, save=True)
+                generate_abc_pdf(updated)
 
                 messages.success(request, 'ABC Form updated successfully!')
                 return redirect('abc_form_list')
@@ -357,7 +393,6 @@ def edit_abc_form(request, form_id):
         else:
             messages.error(request, 'Please correct the form errors')
     else:
-        # The form will automatically parse the instance data
         form = ABCFormForm(instance=instance)
 
     return render(request, 'forms/abc_form.html', {
@@ -366,46 +401,6 @@ def edit_abc_form(request, form_id):
         'instance': instance
     })
 
-def parse_abc_instance(instance):
-    """Helper function to parse the ABCForm instance into individual template fields"""
-
-    def extract_value(text, field_name, default=''):
-        if not text:
-            return default
-        for line in text.split('\n'):
-            if line.startswith(f"{field_name}:"):
-                return line.split(':', 1)[1].strip()
-        return default
-
-    return {
-        'service_user': instance.service_user,
-        'date_of_birth': instance.date_of_birth,
-        'staff': instance.staff,
-        'date_time': instance.date_time,
-        'target_behaviours': instance.target_behaviours,
-
-        # Setting fields
-        'setting_location': extract_value(instance.setting, 'Location'),
-        'setting_present': extract_value(instance.setting, 'Present'),
-        'setting_activity': extract_value(instance.setting, 'Activity'),
-        'setting_environment': extract_value(instance.setting, 'Environment'),
-
-        # Antecedent fields
-        'antecedent_description': extract_value(instance.antecedent, 'Description'),
-        'antecedent_change': extract_value(instance.antecedent, 'Routine change', 'no'),
-        'antecedent_noise': extract_value(instance.antecedent, 'Unexpected noise', 'no'),
-        'antecedent_waiting': extract_value(instance.antecedent, 'Waiting for'),
-
-        # Behaviour field
-        'behaviour_description': extract_value(instance.behaviour, 'Description'),
-
-        # Consequences field
-        'consequence_immediate': extract_value(instance.consequences, 'Immediate'),
-
-        # Reflection field
-        'reflection_learnings': extract_value(instance.reflection, 'Learnings'),
-    }
-
 User = get_user_model()
 
 
@@ -623,7 +618,7 @@ def staff_dashboard(request):
     else:
         staff_list = CustomUser.objects.filter(pk=request.user.pk)
 
-    return render(request, 'staff/dashboard.html', {'staff_list': staff_list})
+    return render(request, 'staff/dashboard.html', {'staff_list': staff_list.select_related('carehome')})
 
 
 # The rest of your views (carehomes, service users) remain the same
@@ -636,10 +631,7 @@ def create_carehome(request):
     if request.method == 'POST':
         form = CareHomeForm(request.POST, request.FILES)
         if form.is_valid():
-            postcode = form.cleaned_data['postcode'].replace(' ', '')
-            api_valid = validate_postcode_with_api(postcode)
-
-            if api_valid:
+            if postcodes.validate(form.cleaned_data['postcode']):
                 # Calculate shift times before saving
                 morning_start = form.cleaned_data['morning_shift_start']
                 if morning_start:
@@ -696,17 +688,6 @@ def delete_carehome(request, id):
     return redirect('carehomes-dashboard')
 
 
-def validate_postcode_with_api(postcode):
-    try:
-        response = requests.get(f'https://api.postcodes.io/postcodes/{postcode}/validate')
-        if response.status_code == 200:
-            data = response.json()
-            return data.get('result', False)
-        return False
-    except requests.RequestException:
-        return False
-
-
 def create_service_user(request):
     carehomes = CareHome.objects.all()
     if request.method == 'POST':
@@ -749,28 +730,20 @@ def delete_service_user(request, id):
 
 
 def service_users_dashboard(request):
-    service_users = ServiceUser.objects.all().order_by('-created_at')
+    service_users = ServiceUser.objects.select_related('carehome').order_by('-created_at')
     return render(request, 'service_users/dashboard.html', {'service_users': service_users})
 
 
 @csrf_exempt
-def validate_postcode(request):
+async def validate_postcode(request):
     if request.method == 'POST':
-        postcode = request.POST.get('postcode', '').replace(' ', '')
-        try:
-            response = requests.get(f'https://api.postcodes.io/postcodes/{postcode}/validate')
-            if response.status_code == 200:
-                data = response.json()
-                return JsonResponse({'valid': data.get('result', False)})
-            return JsonResponse({'valid': False})
-        except requests.RequestException:
-            return JsonResponse({'valid': False})
+        return JsonResponse({'valid': await postcodes.avalidate(request.POST.get('postcode', ''))})
     return JsonResponse({'valid': False})
 
 
 @login_required
 def active_users_view(request):
-    staff_list = get_filtered_queryset(CustomUser, request.user)
+    staff_list = get_filtered_queryset(CustomUser, request.user).select_related('carehome')
     return render(request, 'core/active_users.html', {'staff_list': staff_list})
 
 
@@ -815,6 +788,7 @@ def staff_latest_logs_view(request):
         # Staff: only own logs
         logs = LatestLogEntry.objects.filter(user=user).order_by('-date', '-created_at')
 
+    logs = logs.select_related('service_user', 'carehome')
     return render(request, 'forms/staff_latest_logs.html', {'logs': logs})
 
 
@@ -822,13 +796,9 @@ def staff_latest_logs_view(request):
 def fetch_service_users(request):
     if request.method == "POST":
         data = json.loads(request.body)
-        carehome_ids = data.get('carehome_ids', [])
-        users = ServiceUser.objects.filter(carehome_id__in=carehome_ids)
-
-        response = {
-            'users': [{'id': su.id, 'name': str(su)} for su in users]
-        }
-        return JsonResponse(response)
+        carehome_ids = lookups.parse_carehome_ids(str(i) for i in data.get('carehome_ids', []))
+        rows, _ = lookups.get_rows('service_users', carehome_ids)
+        return JsonResponse({'users': [{'id': u['id'], 'name': u['name']} for u in lookups.flatten(rows)]})
     return JsonResponse({'error': 'Invalid method'}, status=400)
 
 
@@ -844,7 +814,7 @@ def create_mapping(request):
 
 
 def staff_mapping_view(request):
-    mappings = Mapping.objects.all().prefetch_related('carehomes', 'service_users')
+    mappings = Mapping.objects.select_related('staff').prefetch_related('carehomes', 'service_users')
     form = MappingForm()
     mapping_id = request.GET.get('edit', None)
     mapping_instance = None
@@ -880,9 +850,8 @@ def delete_mapping(request, pk):
     return redirect('staff-mapping')
 
 def load_service_users(request):
-    carehome_ids = request.GET.getlist('carehome_ids[]')
-    users = ServiceUser.objects.filter(carehome_id__in=carehome_ids)
-    data = [{'id': u.id, 'name': f"{u.first_name} {u.last_name}"} for u in users]
+    rows, _ = lookups.get_rows('service_users', lookups.parse_carehome_ids(request.GET.getlist('carehome_ids[]')))
+    data = [{'id': u['id'], 'name': u['name']} for u in lookups.flatten(rows)]
     return JsonResponse({'service_users': data})
 
 
@@ -892,23 +861,21 @@ def log_detail_view(request, pk):
     user = request.user
 
     # Permission logic
-    is_owner = latest_log.user == user
-    is_superuser = user.is_superuser
-    is_manager = user.role == 'manager'
-    is_team_lead = user.role == 'team_lead'
+    scope = request.access
+    is_owner = latest_log.user_id == user.id
 
     # Determine access rights
     can_view = False
     can_edit = False
 
-    if is_superuser or is_manager:
+    if scope.is_manager:
         # Managers/superusers can view/edit all logs
         can_view = True
         can_edit = not latest_log.status == 'locked'
 
-    elif is_team_lead:
-        # Team leads can view/edit logs from their carehome
-        if latest_log.carehome == user.carehome:
+    elif scope.is_team_lead:
+        # Team leads can view/edit logs from their carehomes
+        if scope.has_carehome(latest_log.carehome_id):
             can_view = True
             can_edit = (is_owner or not latest_log.status == 'locked')
 
@@ -919,7 +886,7 @@ def log_detail_view(request, pk):
 
     else:
         # Regular staff can only view if they're assigned to the same carehome
-        if hasattr(user, 'carehome') and latest_log.carehome == user.carehome:
+        if user.carehome_id and latest_log.carehome_id == user.carehome_id:
             can_view = True
 
     if not can_view:
@@ -996,7 +963,7 @@ def log_entry_form_view(request, latest_log_id):
     })
 
 def view_incident_report(request, pk):
-    incident = get_object_or_404(IncidentReport, pk=pk)
+    incident = get_object_or_404(IncidentReport.objects.select_related('staff', 'service_user', 'carehome'), pk=pk)
 
     context = {
         'data': {
@@ -1058,21 +1025,12 @@ def generate_log_pdf(latest_log):
         # Also update these entries to point to the latest_log
         log_entries.update(latest_log=latest_log)
 
-        html_string = render_to_string('pdf_templates/log_pdf.html', {
+        pdf = rendering.render_document('shift_log', {
             'latest_log': latest_log,
             'log_entries': log_entries,
         })
-
-        # Ensure directory exists
-        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'log_pdfs'), exist_ok=True)
-
-        pdf_filename = f"log_{latest_log.id}.pdf"
-        pdf_path = os.path.join(settings.MEDIA_ROOT, 'log_pdfs', pdf_filename)
-
-        HTML(string=html_string).write_pdf(pdf_path)
-
-        latest_log.log_pdf.name = f'log_pdfs/{pdf_filename}'
-        latest_log.save()
+        pdf_storage.attach_pdf(latest_log, 'log_pdf', pdf, 'log_pdfs')
+        latest_log.save(update_fields=['log_pdf', 'updated_at'])
         return True
     except Exception as e:
         print(f"Error generating PDF: {str(e)}")
@@ -1128,45 +1086,45 @@ def edit_log_entry_by_admin(request, latest_log_id):
     })
 
 
+def regenerate_log_pdf(latest_log_id):
+    latest_log = LatestLogEntry.objects.filter(pk=latest_log_id).first()
+    if latest_log is not None:
+        latest_log.generate_pdf()
+
+
 @require_POST
 @login_required
-def save_log_entry(request, entry_id):
-    entry = get_object_or_404(LogEntry, id=entry_id)
+async def save_log_entry(request, entry_id):
+    """Autosave of one log slot; the shift's PDF is re-rendered in the background"""
+    entry = await aget_object_or_404(LogEntry, id=entry_id)
     content = request.POST.get('content', '').strip()
 
     if not content:
         return JsonResponse({'success': False, 'error': 'Content cannot be empty'})
 
     try:
-        with transaction.atomic():
-            # REMOVED THE is_locked CHECK
-            entry.content = content
-            entry.save()
-
-            if entry.latest_log:
-                # entry.latest_log.status = 'incomplete'
-                # entry.latest_log.save()
-                if hasattr(entry.latest_log, 'generate_pdf'):
-                    entry.latest_log.generate_pdf()
-
-        return JsonResponse({'success': True})
-
+        # REMOVED THE is_locked CHECK
+        entry.content = content
+        await entry.asave()
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
+    if entry.latest_log_id:
+        # One render for a burst of autosaves, off the event loop
+        await sync_to_async(run_coalesced_in_background)(
+            f'log-pdf:{entry.latest_log_id}', regenerate_log_pdf, entry.latest_log_id
+        )
+    return JsonResponse({'success': True})
 
-def get_staff_by_carehome(request):
-    carehome_id = request.GET.get('carehome_id')
-    staff = User.objects.filter(carehome_id=carehome_id).values('id', 'first_name', 'last_name')
-    staff_list = [{
-        'id': s['id'],
-        'name': f"{s['first_name']} {s['last_name']}"
-    } for s in staff]
+
+async def get_staff_by_carehome(request):
+    rows, _ = await lookups.aget_rows('staff', lookups.parse_carehome_ids(request.GET.getlist('carehome_id')))
+    staff_list = [{'id': s['id'], 'name': s['name']} for s in lookups.flatten(rows)]
     return JsonResponse({'staff': staff_list})
 
 
 @require_GET
-def get_service_users_by_carehome(request):
+async def get_service_users_by_carehome(request):
     # Get the raw parameter value
     carehome_param = request.GET.get('carehome_id') or request.GET.get('carehome_id[]')
 
@@ -1175,16 +1133,11 @@ def get_service_users_by_carehome(request):
 
     try:
         # Handle both single ID and comma-separated IDs
-        if ',' in carehome_param:
-            carehome_ids = [int(id.strip()) for id in carehome_param.split(',')]
-            service_users = ServiceUser.objects.filter(carehome_id__in=carehome_ids)
-        else:
-            service_users = ServiceUser.objects.filter(carehome_id=int(carehome_param))
-
+        rows, _ = await lookups.aget_rows('service_users', lookups.parse_carehome_ids([carehome_param]))
         users_list = [{
-            'id': user.id,
-            'name': user.get_formatted_name()
-        } for user in service_users]
+            'id': user['id'],
+            'name': user['name']
+        } for user in lookups.flatten(rows, name=lookups.formatted_name)]
 
         return JsonResponse({'service_users': users_list})
 
@@ -1194,10 +1147,31 @@ def get_service_users_by_carehome(request):
         return JsonResponse({'error': str(e)}, status=400)
 
 
+def generate_incident_pdf(instance, request):
+    """Render the incident report PDF, images included, and attach it to the instance"""
+    # base_url lets WeasyPrint fetch the media files
+    base_url = request.build_absolute_uri('/')[:-1]
+    pdf = rendering.render_document('incident_report', {'data': instance}, base_url=base_url)
+    pdf_storage.attach_pdf(instance, 'pdf_file', pdf, 'incident_reports')
+    instance.save(update_fields=['pdf_file'])
+
+
+def limit_incident_residents(form, scope, current_id=None):
+    """
+    Offer only the residents of the user's care homes, whose dates of birth the form
+    gets from ``service_user_dob_view``, plus the resident of the report being edited
+    """
+    residents = Q(carehome_id__in=scope.carehome_ids)
+    if current_id:
+        residents |= Q(pk=current_id)
+    form.fields['service_user'].queryset = ServiceUser.objects.filter(residents)
+
+
 @login_required
 def fill_incident_form(request):
     if request.method == 'POST':
         form = IncidentReportForm(request.POST, request.FILES)  # Added request.FILES
+        limit_incident_residents(form, request.access)
         if form.is_valid():
             instance = form.save(commit=False)
             instance.staff = request.user
@@ -1212,35 +1186,14 @@ def fill_incident_form(request):
             instance.carehome = form.cleaned_data['service_user'].carehome
             instance.save()
 
-            # Generate HTML for PDF with images
-            html_string = render_to_string('pdf_templates/incident_pdf.html', {'data': instance})
-
-            # Generate PDF with WeasyPrint
-            temp_pdf = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-            temp_pdf.close()
-
-            # Handle base_url for WeasyPrint to access media files
-            base_url = request.build_absolute_uri('/')[:-1]  # Remove trailing slash
-            HTML(string=html_string, base_url=base_url).write_pdf(temp_pdf.name)
-
-            with open(temp_pdf.name, 'rb') as pdf_file:
-                file_content = ContentFile(pdf_file.read())
-                filename = f'incident_report_{instance.id}.pdf'
-                instance.pdf_file.save(filename, file_content)
-
-            os.unlink(temp_pdf.name)
+            # Generate PDF with images
+            generate_incident_pdf(instance, request)
             return redirect('incident_report_list')
     else:
         form = IncidentReportForm()
-        from django.core.serializers.json import DjangoJSONEncoder
-        import json
-        service_users = ServiceUser.objects.all().values("id", "dob")
-        service_user_dob_map = {str(u["id"]): u["dob"].strftime("%Y-%m-%d") for u in service_users}
+        limit_incident_residents(form, request.access)
 
-    return render(request, 'forms/incident_form.html', {'form': form,
-                                                        'service_user_dob_map': json.dumps(service_user_dob_map,
-                                                                                           cls=DjangoJSONEncoder),
-                                                        })
+    return render(request, 'forms/incident_form.html', {'form': form})
 
 
 @login_required
@@ -1281,7 +1234,7 @@ def incident_report_list_view(request):
             pass
 
     # Ordering and additional processing
-    incidents = incidents.order_by('-incident_datetime')
+    incidents = incidents.select_related('service_user', 'staff').order_by('-incident_datetime')
 
     # Get service users based on filtered incidents
     service_users = ServiceUser.objects.filter(
@@ -1313,6 +1266,7 @@ def edit_incident_form(request, form_id):
 
     if request.method == 'POST':
         form = IncidentReportForm(request.POST, request.FILES, instance=instance)
+        limit_incident_residents(form, request.access, instance.service_user_id)
         if form.is_valid():
             instance = form.save(commit=False)
             instance.staff = request.user
@@ -1335,22 +1289,12 @@ def edit_incident_form(request, form_id):
             instance.save()
 
             # Regenerate PDF with updated images
-            html_string = render_to_string('pdf_templates/incident_pdf.html', {'data': instance})
-            base_url = request.build_absolute_uri('/')[:-1]
-            with tempfile.NamedTemporaryFile(delete=True, suffix='.pdf') as output:
-                HTML(string=html_string, base_url=base_url).write_pdf(output.name)
-                with open(output.name, 'rb') as pdf_file:
-                    file_content = ContentFile(pdf_file.read())
-                    filename = f'incident_report_{instance.id}.pdf'
-                    instance.pdf_file.save(filename, file_content)
+            generate_incident_pdf(instance, request)
 
             return redirect('incident_detail', form_id=instance.id)
     else:
         form = IncidentReportForm(instance=instance)
-    from django.core.serializers.json import DjangoJSONEncoder
-    import json
-    service_users = ServiceUser.objects.all().values("id", "dob")
-    service_user_dob_map = {str(u["id"]): u["dob"].strftime("%Y-%m-%d") for u in service_users}
+        limit_incident_residents(form, request.access, instance.service_user_id)
 
     return render(request, 'forms/incident_form.html', {
         'form': form,
@@ -1358,20 +1302,18 @@ def edit_incident_form(request, form_id):
             {'field': 'image1', 'url': instance.image1.url if instance.image1 else None},
             {'field': 'image2', 'url': instance.image2.url if instance.image2 else None},
             {'field': 'image3', 'url': instance.image3.url if instance.image3 else None},
-        ] ,'service_user_dob_map': json.dumps(service_user_dob_map, cls=DjangoJSONEncoder),
+        ],
     })
 
 
 def download_incident_pdf(request, form_id):
     form_data = get_object_or_404(IncidentReport, id=form_id)
 
-    html_string = render_to_string('pdf_templates/incident_pdf.html', {
+    base_url = request.build_absolute_uri('/')
+    pdf_file = rendering.render_document('incident_report', {
         'data': form_data,
         'request': request  # Important for media URL resolution
-    })
-
-    base_url = request.build_absolute_uri('/')
-    pdf_file = HTML(string=html_string, base_url=base_url).write_pdf()
+    }, base_url=base_url)
 
     response = HttpResponse(pdf_file, content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="incident_report_{form_id}.pdf"'
@@ -1452,28 +1394,60 @@ def generate_time_slots(start_time, end_time):
     return time_slots
 
 
+MISSED_SHIFTS_PAGE_SIZE = 50
+
+
 @login_required
 def missed_shifts_view(request):
-    # Calculate date range (last 6 months)
+    """
+    Unresolved missed shifts grouped by care home, resident and shift, with per care home
+    totals. Filters: ``date_from`` and ``date_to`` (YYYY-MM-DD, default the last 6 months)
+    and ``carehome``.
+    """
     today = timezone.localdate()
-    six_months_ago = today - timedelta(days=180)
-
-    # Debug: Print dates to verify
-    print(f"Date range: {six_months_ago} to {today}")
+    date_from = parse_date_param(request.GET.get('date_from')) or today - timedelta(days=180)
+    date_to = parse_date_param(request.GET.get('date_to')) or today
 
-    # Get all unresolved missed logs in this period
+    carehomes = {carehome.id: carehome for carehome in request.access.carehomes().order_by('name')}
     missed_logs = MissedLog.objects.filter(
-        date__gte=six_months_ago,
-        resolved_at__isnull=True
-    ).select_related('carehome', 'service_user').order_by('-date')
-
-    # Debug: Print count of found logs
-    print(f"Found {missed_logs.count()} missed logs")
+        resolved_at__isnull=True, date__range=(date_from, date_to), carehome_id__in=list(carehomes)
+    )
+    selected_carehome = request.GET.get('carehome')
+    if selected_carehome and selected_carehome.isdigit():
+        missed_logs = missed_logs.filter(carehome_id=int(selected_carehome))
 
+    totals = {
+        row['carehome_id']: row['missed']
+        for row in missed_logs.values('carehome_id').annotate(missed=Count('id')).order_by()
+    }
+    groups = missed_logs.values(
+        'carehome_id', 'service_user_id', 'service_user__first_name', 'service_user__last_name', 'shift',
+    ).annotate(
+        missed=Count('id'), first_missed=Min('date'), last_missed=Max('date'),
+    ).order_by('carehome__name', 'service_user__last_name', 'service_user__first_name', 'shift')
+    page = Paginator(groups, MISSED_SHIFTS_PAGE_SIZE).get_page(request.GET.get('page'))
+    shift_labels = dict(MissedLog.SHIFT_CHOICES)
+    for row in page:
+        carehome = carehomes[row['carehome_id']]
+        row['carehome'] = carehome
+        row['service_user_name'] = lookups.formatted_name(row['service_user__first_name'],
+                                                          row['service_user__last_name'])
+        row['shift_label'] = shift_labels.get(row['shift'], row['shift'])
+        row['shift_time'] = carehome.morning_shift_time if row['shift'] == 'morning' else carehome.night_shift_time
+
+    query = request.GET.copy()
+    query.pop('page', None)
     context = {
-        'missing_entries': missed_logs,
-        'total_missed': missed_logs.count(),
-        'date_range': f"{six_months_ago.strftime('%b %d, %Y')} to {today.strftime('%b %d, %Y')}"
+        'groups': page.object_list,
+        'page_obj': page,
+        'query_string': query.urlencode(),
+        'carehomes': carehomes.values(),
+        'carehome_totals': [(carehomes[carehome_id], missed) for carehome_id, missed in totals.items()],
+        'total_missed': sum(totals.values()),
+        'selected_carehome': selected_carehome,
+        'date_from': date_from,
+        'date_to': date_to,
+        'date_range': f"{date_from.strftime('%b %d, %Y')} to {date_to.strftime('%b %d, %Y')}"
     }
 
     return render(request, 'core/missed_logs.html', context)
@@ -1496,8 +1470,87 @@ def serve_media(request, path):
     logger.error(f"File not found: {file_path}")
     raise Http404("File not found")
 
-def get_service_users(request):
-    carehome_id = request.GET.get('carehome_id')
-    service_users = ServiceUser.objects.filter(carehome_id=carehome_id)
-    data = [{"id": su.id, "name": f"{su.first_name} {su.last_name}"} for su in service_users]
-    return JsonResponse(data, safe=False)
\ No newline at end of file
+async def get_service_users(request):
+    rows, _ = await lookups.aget_rows('service_users', lookups.parse_carehome_ids(request.GET.getlist('carehome_id')))
+    data = [{"id": su['id'], "name": su['name']} for su in lookups.flatten(rows)]
+    return JsonResponse(data, safe=False)
+
+
+@login_required
+@require_GET
+async def lookup_view(request):
+    """
+    Residents or staff of one or more care homes in a single call:
+    ``?kind=service_users&carehome_ids=1,2`` -> ``{"kind": ..., "results": [{"id", "name", "carehome_id"}]}``.
+    Care homes outside the user's access scope are left out. Answers 304 when the
+    browser's ETag still matches the cached rows.
+    """
+    kind = request.GET.get('kind', 'service_users')
+    if kind not in lookups.NAME_KINDS:
+        return JsonResponse({'error': f"Unknown kind '{kind}'"}, status=400)
+    try:
+        carehome_ids = lookups.parse_carehome_ids(
+            request.GET.getlist('carehome_ids') + request.GET.getlist('carehome_ids[]')
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Invalid carehome ID format'}, status=400)
+    scope = await aget_scope(await request.auser())
+    carehome_ids = [carehome_id for carehome_id in carehome_ids if scope.has_carehome(carehome_id)]
+
+    rows, etag = await lookups.aget_rows(kind, carehome_ids)
+    etag = quote_etag(etag)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(
+            {'kind': kind, 'results': lookups.flatten(rows)},
+            json_dumps_params={'separators': (',', ':')},
+        )
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+@require_GET
+async def service_user_dob_view(request):
+    """Date of birth of every resident in the care homes the user can work in, for the incident form"""
+    scope = await aget_scope(await request.auser())
+    dobs, etag = await lookups.aget_dob_map(sorted(scope.carehome_ids))
+    etag = quote_etag(etag)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse({'dobs': dobs}, json_dumps_params={'separators': (',', ':')})
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@user_passes_test(lambda u: u.is_active and u.is_superuser, login_url='admin:login')
+def performance_summary_view(request):
+    """Rolling summary of the slowest endpoints served by this worker process"""
+    from django.contrib import admin
+
+    return render(request, 'admin/performance_summary.html', {
+        **admin.site.each_context(request),
+        'title': 'Slowest endpoints',
+        'rows': request_stats.summary(),
+        'render_rows': rendering.render_stats.summary(),
+        'slow_ms': getattr(settings, 'PERFORMANCE_SLOW_REQUEST_MS', 1000),
+    })
+
+
+@user_passes_test(lambda u: u.is_active and u.is_superuser, login_url='admin:login')
+def slow_queries_view(request):
+    """Most recent slow queries with their origin and EXPLAIN plan"""
+    from django.contrib import admin
+
+    if request.method == 'POST':
+        slow_queries.clear()
+        return redirect('slow-queries')
+
+    return render(request, 'admin/slow_queries.html', {
+        **admin.site.each_context(request),
+        'title': 'Slow queries',
+        'entries': slow_queries.entries(),
+        'enabled': slow_queries.enabled,
+        'threshold_ms': getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 100),
+    })